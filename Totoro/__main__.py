@@ -1,9 +1,31 @@
+import time
+
+started = time.perf_counter()
+
 import asyncio
 import os
 
-from core import TotoroBot
+from core import (
+    ClusterSupervisor,
+    TotoroBot,
+    TotoroConfigHandler,
+    cluster_from_env,
+    setup_logging,
+)
 
 if __name__ == "__main__":
+    imports = time.perf_counter() - started
     if os.name == "nt":
         asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
-    asyncio.run(TotoroBot().startup())
+    config = TotoroConfigHandler()
+    cluster = cluster_from_env()
+    if cluster is None and config.get("clusters", 1) > 1:
+        setup_logging(config)
+        supervisor = ClusterSupervisor(
+            config.get("token"), config.get("clusters"), config.get("shard_count")
+        )
+        asyncio.run(supervisor.run())
+    else:
+        bot = TotoroBot(cluster)
+        bot.startup_timer.record("imports", imports)
+        asyncio.run(bot.startup())
@@ -1,51 +1,105 @@
+import difflib
+from typing import Optional
+
 import discord
 from core import TotoroBot
 from discord.ext import commands
 
+# What commands.is_owner() checks with, to tell owner only commands apart
+_OWNER_CHECK = commands.is_owner().predicate.__qualname__
 
-class TotoroHelpCommand(commands.HelpCommand):
-    """Custom help command for Totoro"""
 
-    async def send_bot_help(self, _):
-        bot = self.context.bot
-        await self.get_destination().send(
-            embed=discord.Embed(
+class HelpCatalog:
+    """Every help embed rendered up front, plus a name index for lookups and typos
+
+    Hidden commands are left out entirely, like the default help commands do.
+    Owner only commands are only part of the catalog built for owners.
+    """
+
+    def __init__(self, bot: TotoroBot, *, owner: bool = False):
+        self.owner = owner
+        cogs = [cog for cog in bot.cogs.values() if self._visible(cog.get_commands())]
+        self.bot_embed = self._bot_embed(bot, cogs)
+        self.cogs = {cog.qualified_name.casefold(): self._cog_embed(bot, cog) for cog in cogs}
+        self.commands: dict[str, discord.Embed] = {}
+        for cmd in bot.walk_commands():
+            if not all(self._shown(c) for c in (cmd, *cmd.parents)):
+                continue
+            embed = self._command_embed(cmd)
+            for name in self._names(cmd):
+                self.commands.setdefault(name.casefold(), embed)
+        self._cog_names = {cog.qualified_name for cog in cogs}
+        self.names = [*self.commands, *self.cogs.keys() - self.commands.keys()]
+        self._suggestions: dict[str, list[str]] = {}
+
+    def get(self, name: str) -> Optional[discord.Embed]:
+        """A module's or command's embed, exact module names first like the default help"""
+        key = " ".join(name.casefold().split())
+        if name in self._cog_names:
+            return self.cogs[key]
+        return self.commands.get(key) or self.cogs.get(key)
+
+    def suggest(self, name: str, limit: int = 3) -> list[str]:
+        """Closest command and module names to a misspelled one"""
+        key = " ".join(name.casefold().split())
+        if key not in self._suggestions:
+            if len(self._suggestions) > 1000:
+                self._suggestions.clear()
+            self._suggestions[key] = difflib.get_close_matches(
+                key, self.names, n=limit, cutoff=0.6
+            )
+        return self._suggestions[key]
+
+    def _shown(self, cmd: commands.Command) -> bool:
+        if cmd.hidden:
+            return False
+        return self.owner or not any(c.__qualname__ == _OWNER_CHECK for c in cmd.checks)
+
+    def _visible(self, cmds: list[commands.Command]) -> list[commands.Command]:
+        return [cmd for cmd in cmds if self._shown(cmd)]
+
+    @classmethod
+    def _names(cls, cmd: commands.Command) -> list[str]:
+        """Every way of invoking a command, through its parents' aliases too"""
+        names = [cmd.name, *cmd.aliases]
+        if cmd.parent is None:
+            return names
+        return [f"{parent} {name}" for parent in cls._names(cmd.parent) for name in names]
+
+    @staticmethod
+    def _bot_embed(bot: TotoroBot, cogs: list[commands.Cog]) -> discord.Embed:
+        return (
+            discord.Embed(
                 title=":wave: Hi there I am Totoro",
                 description="I am a private music/utility bot based off the movie My Neighbor Totoro. uhhhhhhh- and thats basically all",
                 color=discord.Color.green(),
             )
             .add_field(
-                name="Module List", value="\n".join([f"`{cog}`" for cog in bot.cogs])
-            )
-            .set_footer(
-                text="Use t!help <command/module>",
-                icon_url=self.context.author.display_avatar.url,
+                name="Module List",
+                value="\n".join([f"`{cog.qualified_name}`" for cog in cogs]),
             )
+            .set_footer(text="Use t!help <command/module>")
             .set_thumbnail(url=bot.user.display_avatar.url)
         )
 
-    async def send_cog_help(self, cog: commands.Cog):
-        bot = self.context.bot
-        await self.get_destination().send(
-            embed=discord.Embed(
+    def _cog_embed(self, bot: TotoroBot, cog: commands.Cog) -> discord.Embed:
+        cmds = self._visible(cog.get_commands())
+        return (
+            discord.Embed(
                 title=f"Module: `{cog.qualified_name}`",
                 description=cog.description,
                 color=discord.Color.green(),
             )
             .add_field(
-                name=f"Commands({len(cog.get_commands())}):",
-                value=", ".join([f"`{cmd}`" for cmd in cog.get_commands()]),
+                name=f"Commands({len(cmds)}):",
+                value=", ".join([f"`{cmd}`" for cmd in cmds]),
             )
             .set_thumbnail(url=bot.user.display_avatar.url)
-            .set_footer(
-                icon_url=self.context.author.display_avatar.url,
-                text="Do t!help <cmd> to get more info on a specific command",
-            )
+            .set_footer(text="Do t!help <cmd> to get more info on a specific command")
         )
 
-    async def send_command_help(self, cmd: commands.Command):
-        aliases = cmd.aliases
-        cd = cmd._buckets._cooldown
+    def _command_embed(self, cmd: commands.Command) -> discord.Embed:
+        cd = cmd.cooldown
         embed = discord.Embed(
             title=f"Command: `{cmd.qualified_name}`",
             description=cmd.description,
@@ -53,18 +107,88 @@ class TotoroHelpCommand(commands.HelpCommand):
         ).add_field(name="Module", value=f"`{cmd.cog_name}`")
         if cd:
             embed.add_field(
-                name="Cooldown",
-                value=f"Rate: {cd.rate} | Cooldown(in seconds): {cd.per}",
+                name="Cooldown", value=f"Rate: {cd.rate} | Cooldown(in seconds): {cd.per}"
+            )
+        if cmd.aliases:
+            embed.add_field(name="Aliases", value="\n".join(cmd.aliases))
+        if isinstance(cmd, commands.Group):
+            embed.add_field(
+                name="Subcommands",
+                value="\n".join(
+                    f"`{sub.name}` {sub.short_doc}" for sub in self._visible(cmd.commands)
+                ),
+                inline=False,
+            )
+        return embed
+
+
+class TotoroHelpCommand(commands.HelpCommand):
+    """Custom help command for Totoro"""
+
+    @property
+    def catalog(self) -> HelpCatalog:
+        bot = self.context.bot
+        return bot.get_cog("Help").get_catalog(owner=self.context.author.id in bot.owner_ids)
+
+    async def send_embed(self, embed: discord.Embed) -> None:
+        # Shared embeds are copied, only the footer icon differs per user
+        if embed.footer.text:
+            embed = embed.copy().set_footer(
+                text=embed.footer.text, icon_url=self.context.author.display_avatar.url
             )
-        if aliases:
-            embed.add_field(name="Aliases", value="\n".join(aliases))
         await self.get_destination().send(embed=embed)
 
+    async def command_callback(
+        self, ctx: commands.Context, /, *, command: Optional[str] = None
+    ):
+        await self.prepare_help_command(ctx, command)
+        if command is None:
+            return await self.send_embed(self.catalog.bot_embed)
+        embed = self.catalog.get(command)
+        if embed is None:
+            return await self.send_error_message(self.command_not_found(command))
+        await self.send_embed(embed)
+
+    def command_not_found(self, string: str) -> str:
+        message = f'No command or module called "{self.remove_mentions(string)}" found.'
+        suggestions = self.catalog.suggest(string)
+        if suggestions:
+            message += f" Did you mean {', '.join(f'`{name}`' for name in suggestions)}?"
+        return message
+
+    async def send_bot_help(self, _):
+        await self.send_embed(self.catalog.bot_embed)
+
+    async def send_cog_help(self, cog: commands.Cog):
+        await self.send_embed(self.catalog.cogs[cog.qualified_name.casefold()])
+
+    async def send_command_help(self, cmd: commands.Command):
+        await self.send_embed(self.catalog.commands[cmd.qualified_name.casefold()])
+
+    async def send_group_help(self, group: commands.Group):
+        await self.send_command_help(group)
+
 
 class Help(commands.Cog):
     def __init__(self, bot: TotoroBot):
+        self.bot = bot
+        self._catalogs: dict[bool, HelpCatalog] = {}  # Keyed by whether it's for owners
+        self._built_for = -1
         bot.help_command = TotoroHelpCommand()
 
+    def get_catalog(self, *, owner: bool = False) -> HelpCatalog:
+        # Built on first use and rebuilt once after cogs are loaded or unloaded,
+        # so loading every extension at startup only builds it once
+        if self._built_for != self.bot.cog_generation:
+            self._catalogs.clear()
+            self._built_for = self.bot.cog_generation
+        if owner not in self._catalogs:
+            self._catalogs[owner] = HelpCatalog(self.bot, owner=owner)
+        return self._catalogs[owner]
+
+    async def cog_unload(self) -> None:
+        self.bot.help_command = commands.DefaultHelpCommand()
+
 
 async def setup(bot: TotoroBot):
     await bot.add_cog(Help(bot))
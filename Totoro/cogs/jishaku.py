@@ -1,9 +1,27 @@
 import os
 
+from core import TotoroBot
+from discord.ext import commands
+
 os.environ["JISHAKU_NO_UNDERSCORE"] = "True"
 os.environ["JISHAKU_NO_DM_TRACEBACK"] = "True"
 os.environ["JISHAKU_HIDE"] = "True"
 
 
-async def setup(bot):
-    await bot.load_extension("jishaku")
+class LazyJishaku(commands.Cog, name="Jishaku"):
+    """Stands in for jishaku until it's first used, importing it slows down startup"""
+
+    def __init__(self, bot: TotoroBot):
+        self.bot = bot
+
+    @commands.command(name="jishaku", aliases=["jsk"], hidden=True)
+    @commands.is_owner()
+    async def jishaku(self, ctx: commands.Context, *, _: str = ""):
+        await self.bot.remove_cog(self.qualified_name)
+        await self.bot.load_extension("jishaku")
+        # Run the message again now that the real jishaku commands exist
+        await self.bot.process_commands(ctx.message)
+
+
+async def setup(bot: TotoroBot):
+    await bot.add_cog(LazyJishaku(bot))
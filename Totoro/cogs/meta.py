@@ -1,8 +1,11 @@
+import io
 import platform
 import random
+from datetime import datetime
+from typing import Optional
 
 import discord
-from core import TotoroBot
+from core import SamplingProfiler, SlowCallbackDetector, TotoroBot, rss_bytes
 from discord.ext import commands
 
 
@@ -11,6 +14,14 @@ class Meta(commands.Cog):
 
     def __init__(self, bot: TotoroBot):
         self.bot = bot
+        self.profiler: Optional[SamplingProfiler] = None
+        self.slow_callbacks: Optional[SlowCallbackDetector] = None
+
+    async def cog_unload(self) -> None:
+        if self.profiler:
+            self.profiler.stop()
+        if self.slow_callbacks:
+            self.slow_callbacks.stop()
 
     @commands.command()
     @commands.is_owner()
@@ -26,10 +37,16 @@ class Meta(commands.Cog):
         msg_latency = round(
             (msg.created_at - ctx.message.created_at).total_seconds() * 1000
         )
+        description = f"WebSocket/Gateway: {round(self.bot.latency* 1000)}ms\nMessage: {msg_latency}ms"
+        if self.bot.cluster:
+            description += "".join(
+                f"\nCluster {s['cluster']}: {round(s['latency'] * 1000)}ms"
+                for s in await self.bot.gather_stats()
+            )
         await msg.edit(
             embed=discord.Embed(
                 title="Totoro's Latency",
-                description=f"WebSocket/Gateway: {round(self.bot.latency* 1000)}ms\nMessage: {msg_latency}ms",
+                description=description,
                 color=discord.Color.green(),
             )
         )
@@ -37,8 +54,12 @@ class Meta(commands.Cog):
     @commands.command()
     async def info(self, ctx: commands.Context):
         """Information about the bot itself"""
-        await ctx.send(
-            embed=discord.Embed(
+        stats = await self.bot.gather_stats()
+        guilds = sum(s["guilds"] for s in stats)
+        users = sum(s["users"] for s in stats)
+        latency = sum(s["latency"] for s in stats) / len(stats)
+        embed = (
+            discord.Embed(
                 title="Hi again! Heres sum info about me",
                 description="First and foremost [this](https://github.com/Yat-o/Totoro) right here is my source code",
                 color=discord.Color.green(),
@@ -50,7 +71,7 @@ class Meta(commands.Cog):
             )
             .add_field(
                 name="Guilds | Users",
-                value=f"Guilds: {len(self.bot.guilds)} | Users: {len(self.bot.users)}",
+                value=f"Guilds: {guilds} | Users: {'' if self.bot.members_cached else '~'}{users}",
             )
             .add_field(
                 name="Uptime", value=discord.utils.format_dt(self.bot.start_time, "R")
@@ -58,7 +79,7 @@ class Meta(commands.Cog):
             .add_field(
                 name="Owner(s)",
                 value="\n".join(
-                    [str(self.bot.get_user(oid)) for oid in self.bot.owner_ids]
+                    [str(self.bot.get_user(oid) or f"<@{oid}>") for oid in self.bot.owner_ids]
                 ),
             )
             .add_field(
@@ -67,11 +88,136 @@ class Meta(commands.Cog):
             )
             .add_field(
                 name="Latency",
-                value=f"{round(self.bot.latency * 1000)}ms",
+                value=f"{round(latency * 1000)}ms",
                 inline=False,
             )
         )
+        if self.bot.cluster:
+            embed.add_field(
+                name="Clusters",
+                value=f"{len(stats)} responding, this is cluster {self.bot.cluster.id}",
+                inline=False,
+            )
+        await ctx.send(embed=embed)
     
+    @commands.command()
+    @commands.is_owner()
+    async def stats(self, ctx: commands.Context):
+        """Performance stats: command latency, event loop lag, shards and players"""
+        metrics = self.bot.metrics
+        slowest = sorted(
+            metrics.command_latency.items(),
+            key=lambda item: item[1].quantile(0.99),
+            reverse=True,
+        )[:8]
+        players = metrics.players()
+        rss = rss_bytes()
+        embed = (
+            discord.Embed(title="Totoro's Stats", color=discord.Color.green())
+            .add_field(
+                name="Commands (p50 | p99 | calls | errors)",
+                value="\n".join(
+                    f"`{name}`: {hist.quantile(0.5) * 1000:.0f}ms | {hist.quantile(0.99) * 1000:.0f}ms"
+                    f" | {hist.count} | {metrics.command_errors[name]}"
+                    for name, hist in slowest
+                )
+                or "No commands run yet",
+                inline=False,
+            )
+            .add_field(
+                name="Event Loop Lag",
+                value=f"p50: {metrics.loop_lag.quantile(0.5) * 1000:.0f}ms\n"
+                f"p99: {metrics.loop_lag.quantile(0.99) * 1000:.0f}ms\n"
+                f"max: {metrics.loop_lag.max * 1000:.0f}ms",
+            )
+            .add_field(
+                name="Shards",
+                value="\n".join(
+                    f"#{shard_id}: {latency * 1000:.0f}ms"
+                    for shard_id, latency in self.bot.latencies
+                ),
+            )
+            .add_field(
+                name="Players",
+                value=f"Active: {len(players)}\n"
+                f"Queued tracks: {sum(len(p.queue) for p in players)}\n"
+                f"Reaped: {sum(metrics.players_reaped.values())} ({metrics.reaped_tracks} tracks)\n"
+                f"Nodes: {len(self.bot.node_manager.available_nodes())}/{len(self.bot.node_pool.nodes)}",
+            )
+        )
+        if rss is not None:
+            embed.set_footer(text=f"RSS: {rss / 1024**2:.1f} MiB")
+        await ctx.send(embed=embed)
+
+    @commands.command()
+    @commands.is_owner()
+    async def sync(self, ctx: commands.Context):
+        """Register the slash commands with Discord, needed after they change"""
+        synced = await self.bot.tree.sync()
+        await ctx.send(f"Synced {len(synced)} slash commands")
+
+    @commands.command()
+    @commands.is_owner()
+    async def profile(self, ctx: commands.Context, seconds: float = 10.0):
+        """Sample the event loop for some seconds and upload a collapsed stack file"""
+        if self.profiler and self.profiler.running:
+            return await ctx.send("Already profiling, wait for it to finish")
+        seconds = min(max(seconds, 1.0), 120.0)
+        self.profiler = SamplingProfiler(
+            interval=self.bot.config.get("profiler_interval", 0.005)
+        )
+        msg = await ctx.send(f"Profiling for {seconds:g}s...")
+        await self.profiler.profile(seconds)
+        samples = sum(self.profiler.samples.values())
+        hottest = "\n".join(
+            f"`{name}` {count / samples:.0%}" for name, count in self.profiler.hottest(8)
+        )
+        await msg.edit(
+            content=None,
+            embed=discord.Embed(
+                title="Profile",
+                description=f"{samples} samples over {self.profiler.duration:.1f}s\n"
+                "Open the file with speedscope or flamegraph.pl",
+                color=discord.Color.green(),
+            ).add_field(name="Hottest", value=hottest or "Nothing sampled"),
+            attachments=[
+                discord.File(
+                    io.BytesIO(self.profiler.collapsed().encode()),
+                    filename=f"totoro-{datetime.now():%Y%m%d-%H%M%S}.folded",
+                )
+            ],
+        )
+
+    @commands.command(aliases=["slowcb"])
+    @commands.is_owner()
+    async def slowcallbacks(self, ctx: commands.Context, threshold_ms: Optional[int] = None):
+        """Toggle reporting what blocks the event loop for longer than threshold_ms"""
+        detector = self.slow_callbacks
+        if detector and detector.running and threshold_ms is None:
+            detector.stop()
+            stalls = sorted(detector.stalls, key=lambda s: s.duration, reverse=True)[:10]
+            return await ctx.send(
+                embed=discord.Embed(
+                    title="Slow callback detection off",
+                    description="\n".join(
+                        f"{discord.utils.format_dt(datetime.fromtimestamp(s.started), 'T')} "
+                        f"**{s.duration * 1000:.0f}ms** `{s.culprit or s.task}`"
+                        for s in stalls
+                    )
+                    or f"Nothing blocked for over {detector.threshold * 1000:.0f}ms",
+                    color=discord.Color.green(),
+                )
+            )
+        if detector:
+            detector.stop()
+        threshold = (threshold_ms or self.bot.config.get("slow_callback_threshold", 100)) / 1000
+        self.slow_callbacks = SlowCallbackDetector(threshold=threshold)
+        self.slow_callbacks.start()
+        await ctx.send(
+            f"Reporting event loop stalls over {threshold * 1000:.0f}ms, "
+            "run again without a threshold to stop"
+        )
+
     @commands.command(aliases=["8ball"])
     async def eightball(self, ctx: commands.Context, *, question: str):
         responses = ["yes", "no", "maybe"]
@@ -1,26 +1,394 @@
 import asyncio
-from datetime import timedelta
+import copy
+import json
+import logging
+import operator
+import time
+from typing import Callable, Literal, Optional, Union
 
 import discord
 import pomice
-from core import TotoroBot
-from discord.ext import commands
+from core import TotoroBot, node_penalty
+from discord import app_commands
+from discord.ext import commands, tasks
 from discord.ui import Select, View
-from utils import Paginator, chunk_iter, humanize_timedelta
+from utils import (
+    FILTER_PRESETS,
+    ActionScheduler,
+    IndexedTrack,
+    Paginator,
+    PlayerDisplay,
+    QueueEntry,
+    TrackQueue,
+    canonical_presets,
+    merge_presets,
+    normalize_query,
+)
 
 
 class TotoroPlayer(pomice.Player):
     """Customer subclass of Pomice's Player class to add Queue functionality"""
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._queue = pomice.Queue()
+    LOOP_MODES = {
+        "off": None,
+        "track": pomice.LoopMode.TRACK,
+        "queue": pomice.LoopMode.QUEUE,
+    }
+
+    def __init__(
+        self,
+        client: TotoroBot,
+        channel: discord.VoiceChannel,
+        *,
+        node: Optional[pomice.Node] = None,
+    ):
+        if node is None:
+            node = client.node_manager.select_node(channel.rtc_region)
+        super().__init__(client, channel, node=node)
+        self._queue = TrackQueue(
+            max_size=client.config.get("queue_max_size", 5000),
+            history_size=client.config.get("queue_history_size", 50),
+        )
+        self._background: set[asyncio.Task] = set()
+        self._snapshot_queue: tuple[int, str] = (-1, "[]")
+        self._prefetch_task: Optional[asyncio.Task] = None
+        self._held_position: Optional[int] = None
+        # None until the first play applies the guild's default presets
+        self.filter_presets: Optional[tuple[str, ...]] = None
+        self.actions = ActionScheduler(
+            window=client.config.get("player_action_window", 0.25),
+            spawn=self.create_task,
+        )
+        self.display = PlayerDisplay(
+            self, refresh_interval=client.config.get("live_nowplaying_interval", 10)
+        )
 
     @property
-    def queue(self) -> pomice.Queue:
-        """Pomice's implmentation of a queue system"""
+    def queue(self) -> TrackQueue:
+        """Compact queue of upcoming tracks"""
         return self._queue
 
+    async def get_tracks(
+        self,
+        query: str,
+        *,
+        ctx: Optional[commands.Context] = None,
+        search_type: Optional[pomice.SearchType] = pomice.SearchType.ytsearch,
+        filters: Optional[list[pomice.Filter]] = None,
+    ) -> Optional[Union[list[pomice.Track], pomice.Playlist]]:
+        """Resolve a query through the bot's shared track cache"""
+        if filters:  # Preloaded filters are baked into the tracks, don't share those
+            return await super().get_tracks(
+                query, ctx=ctx, search_type=search_type, filters=filters
+            )
+        result = await self.client.track_cache.get_or_fetch(
+            (normalize_query(query), str(search_type)),
+            lambda: super(TotoroPlayer, self).get_tracks(
+                query, search_type=search_type
+            ),
+        )
+        return self._stamp_requester(result, ctx)
+
+    async def resolve(self, track: pomice.Track) -> Optional[pomice.Track]:
+        """Resolve a Spotify/Apple Music track to a playable one ahead of time
+
+        Returns None if no equivalent track could be found.
+        """
+        if track.original is not None:
+            return track
+        search_type = track._search_type or pomice.SearchType.ytsearch
+        queries = [track.isrc] if track.isrc else []
+        queries.append(f"{track.title} - {track.author}")
+        for query in queries:
+            try:
+                results = await self.get_tracks(query, search_type=search_type)
+            except pomice.TrackLoadError:
+                continue
+            if results and not isinstance(results, pomice.Playlist):
+                # Same bookkeeping pomice does in Player.play, so it won't search again
+                track.original = results[0]
+                track.track_id = results[0].track_id
+                return track
+        return None
+
+    def prefetch(self) -> None:
+        """Make sure the next few queued tracks are playable before their turn"""
+        if self._prefetch_task is None or self._prefetch_task.done():
+            self._prefetch_task = self.create_task(self._prefetch())
+
+    async def _prefetch(self) -> None:
+        depth = self.client.config.get("prefetch_depth", 3)
+        retries = self.client.config.get("prefetch_retries", 1)
+        while pending := [e for e in self.queue.peek(depth) if not e.playable]:
+            for entry in pending:
+                resolved = None
+                for attempt in range(retries + 1):
+                    if attempt:
+                        await asyncio.sleep(attempt)
+                    resolved = await self.resolve(entry.to_track())
+                    if resolved:
+                        break
+                if resolved:
+                    self.queue.replace(entry, QueueEntry.from_track(resolved), within=depth)
+                elif self.queue.discard(entry, within=depth):
+                    self.client.logger.info(
+                        f"Skipped unplayable track {entry.title} in guild {self.guild.id}"
+                    )
+
+    def create_task(self, coro) -> asyncio.Task:
+        """Run a coroutine tied to this player's lifetime"""
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def play(self, track: pomice.Track, **kwargs) -> pomice.Track:
+        if self.filter_presets is None:
+            self.filter_presets = ()
+            presets = self.client.guild_filters.get(self.guild.id)
+            if presets:
+                await self.set_filter_presets(presets)
+        return await super().play(track, **kwargs)
+
+    async def set_filter_presets(self, presets: tuple[str, ...]) -> tuple[str, ...]:
+        """Replace the player's filters with merged presets in a single Lavalink update"""
+        filters = pomice.Filters()
+        for preset in merge_presets(presets):
+            filters.add_filter(filter=preset)
+        self._filters = filters
+        self.filter_presets = presets
+        await self._node.send(
+            method="PATCH",
+            path=self._player_endpoint_uri,
+            guild_id=self.guild.id,
+            data={"filters": filters.get_all_payloads()},
+        )
+        return presets
+
+    async def change_filter_presets(
+        self, change: Callable[[tuple[str, ...]], tuple[str, ...]]
+    ) -> tuple[str, ...]:
+        return await self.set_filter_presets(change(self.filter_presets or ()))
+
+    async def skip_tracks(self, count: int) -> int:
+        """Skip the current track and the count - 1 tracks after it"""
+        for _ in range(count - 1):
+            try:
+                self.queue.get(repeat=False)
+            except pomice.QueueEmpty:
+                break
+        await self.stop()
+        return count
+
+    async def toggle_pause(self, toggles: int) -> bool:
+        """Apply a number of pause toggles, only flipping once if it's odd"""
+        if toggles % 2:
+            await self.set_pause(not self.is_paused)
+        return self.is_paused
+
+    def hold(self) -> None:
+        """Remember where playback stopped, called when the player's node goes down"""
+        self._held_position = int(self.position) if self.current else 0
+
+    async def migrate(self, node: pomice.Node) -> None:
+        """Move this player to another node, resuming the current track where it was"""
+        position = self._held_position
+        if position is None:
+            position = int(self.position) if self.current else 0
+        self._held_position = None
+        self._node._players.pop(self.guild.id, None)
+        self._node = node
+        node._players[self.guild.id] = self
+        await self._refresh_endpoint_uri(node._session_id)
+        await self._dispatch_voice_update()
+        data = {
+            "volume": self.volume,
+            "paused": self.is_paused,
+            "filters": self.filters.get_all_payloads(),
+        }
+        if self.current:
+            data.update(encodedTrack=self.current.track_id, position=position)
+        await node.send(
+            method="PATCH",
+            path=self._player_endpoint_uri,
+            guild_id=self.guild.id,
+            data=data,
+        )
+        # Keep the position ticking until the new node sends its first update
+        self._last_position, self._last_update = position, time.time() * 1000
+
+    async def disconnect(self, *, force: bool = False) -> None:
+        for task in self._background:
+            task.cancel()
+        if self.channel is not None:
+            await super().disconnect(force=force)
+        # pomice only forgets the Lavalink player in destroy(), left behind it would
+        # keep its node busy and get migrated along with live players on failover
+        if self._node._players.pop(self.guild.id, None) and self._node.is_connected:
+            await self._node.send(
+                method="DELETE", path=self._player_endpoint_uri, guild_id=self.guild.id
+            )
+
+    async def destroy(self) -> None:
+        await self.disconnect()
+
+    def snapshot(self) -> Optional[dict]:
+        """Capture what is needed to resume this player after a restart"""
+        if not self.channel or not (self.current or self.queue):
+            return None
+        if self._snapshot_queue[0] != self.queue.version:  # Only re-encode on change
+            self._snapshot_queue = (
+                self.queue.version,
+                json.dumps([entry.to_record() for entry in self.queue]),
+            )
+        return {
+            "guild_id": self.guild.id,
+            "channel_id": self.channel.id,
+            "current": json.dumps(QueueEntry.from_track(self.current).to_record())
+            if self.current
+            else None,
+            "position": int(self.position) if self.current else 0,
+            "volume": self.volume,
+            "paused": self.is_paused,
+            "loop_mode": self.queue.loop_mode.value if self.queue.loop_mode else None,
+            "queue": self._snapshot_queue[1],
+        }
+
+    async def restore(self, snapshot: dict) -> None:
+        """Load a snapshot's queue and resume its track where it left off"""
+
+        def entry(record: list) -> QueueEntry:
+            requester = self.guild.get_member(record[-1]) if record[-1] else None
+            return QueueEntry.from_record(record, requester)
+
+        self.queue.put_many(entry(r) for r in json.loads(snapshot["queue"]))
+        if snapshot["loop_mode"]:
+            self.queue.set_loop_mode(pomice.LoopMode(snapshot["loop_mode"]))
+        if snapshot["volume"] != self.volume:
+            await self.set_volume(snapshot["volume"])
+        if snapshot["current"]:
+            current = entry(json.loads(snapshot["current"]))
+            self.queue.current = current
+            await self.play(current.to_track(), start=snapshot["position"])
+            if snapshot["paused"]:
+                await self.set_pause(True)
+
+    @staticmethod
+    def _stamp_requester(
+        result: Optional[Union[list[pomice.Track], pomice.Playlist]],
+        ctx: Optional[commands.Context],
+    ) -> Optional[Union[list[pomice.Track], pomice.Playlist]]:
+        """Copy cached tracks so each requester gets their own Track objects"""
+
+        def stamp(track: pomice.Track) -> pomice.Track:
+            track = copy.copy(track)
+            track.ctx = ctx
+            track.requester = ctx.author if ctx else None
+            return track
+
+        if not result:
+            return result
+        if isinstance(result, pomice.Playlist):
+            return pomice.Playlist(
+                playlist_info=result.playlist_info,
+                tracks=[stamp(t) for t in result.tracks],
+                playlist_type=result.playlist_type,
+                thumbnail=result.thumbnail,
+                uri=result.uri,
+            )
+        return [stamp(t) for t in result]
+
+
+class PlaylistIngestion:
+    """Streams a playlist into a player's queue
+
+    The first track is resolved and played straight away, the rest are
+    resolved in the background by a bounded number of workers and enqueued
+    in their original order. Progress is reported by editing a message.
+    """
+
+    PROGRESS_INTERVAL = 3  # Seconds between progress message edits
+
+    def __init__(
+        self,
+        player: TotoroPlayer,
+        playlist: pomice.Playlist,
+        message: discord.Message,
+        *,
+        workers: int,
+    ):
+        self.player = player
+        self.tracks = playlist.tracks
+        self.message = message
+        self.workers = workers
+        self.enqueued = 0
+        self.failed = 0
+        self._last_progress = 0.0
+
+    @property
+    def done(self) -> int:
+        return self.enqueued + self.failed
+
+    async def run(self) -> None:
+        tracks = iter(self.tracks)
+        if not self.player.current:
+            for track in tracks:
+                if await self.player.resolve(track):
+                    # Through the queue, so it becomes the queue's current track
+                    try:
+                        self.player.queue.put(track)
+                    except pomice.QueueFull:
+                        self.failed += 1
+                        break
+                    track = self.player.queue.get()
+                    await self.player.play(track)
+                    self.enqueued += 1
+                    await self.message.reply(f":notes: Now playing {track.title}")
+                    break
+                self.failed += 1
+        window: list[pomice.Track] = []
+        for track in tracks:
+            if self.player.queue.is_full:
+                break
+            window.append(track)
+            if len(window) == self.workers:
+                await self._enqueue(window)
+                window = []
+        if window:
+            await self._enqueue(window)
+        await self._report(final=True)
+
+    async def _enqueue(self, window: list[pomice.Track]) -> None:
+        resolved = await asyncio.gather(*[self.player.resolve(t) for t in window])
+        for track in resolved:
+            if track is None:
+                self.failed += 1
+                continue
+            try:
+                self.player.queue.put(track)
+            except pomice.QueueFull:
+                self.failed += 1
+                continue
+            self.enqueued += 1
+        self.player.prefetch()
+        await self._report()
+
+    async def _report(self, *, final: bool = False) -> None:
+        now = asyncio.get_running_loop().time()
+        if not final and now - self._last_progress < self.PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        if final:
+            content = f":scroll: Enqueued {self.enqueued} tracks to the queue"
+        else:
+            content = f":scroll: Enqueued {self.done}/{len(self.tracks)} tracks..."
+        if self.failed:
+            content += f" ({self.failed} unavailable)"
+        try:
+            await self.message.edit(content=content)
+        except discord.HTTPException:
+            pass
+
 
 class SelectorView(View):
     def __init__(self):
@@ -54,52 +422,119 @@ class TotoroTrackSelector(Select):
             )
         player: TotoroPlayer = self.ctx.voice_client
         track: pomice.Track = self.tracks[int(self.values[0])]
-        if player.current:
+        action, _ = player.actions.submit("select", track, self.select)
+        await inter.followup.send(await action.future)
+
+    async def select(self, track: pomice.Track) -> str:
+        player: TotoroPlayer = self.ctx.voice_client
+        try:
             player.queue.put(track)
-            await inter.followup.send(f"Added {track.title} to the queue")
-        else:
-            await player.play(track)
-            await inter.followup.send(f"Now playing {track.title}")
+        except pomice.QueueFull:
+            return ":x: The queue is full"
+        if player.current:
+            player.prefetch()
+            return f"Added {track.title} to the queue"
+        await player.play(player.queue.get())
+        return f"Now playing {track.title}"
 
 
 class Music(commands.Cog):
     def __init__(self, bot: TotoroBot):
         self.bot = bot
+        self.logger = logging.getLogger(__name__)
         if self.bot.node_pool.node_count == 0:
+            self.bot.startup_timer.expect("node connect")
             asyncio.get_event_loop().create_task(self._establish_lava_node())
+        self.snapshotter.change_interval(
+            seconds=self.bot.config.get("snapshot_interval", 30)
+        )
+        self.snapshotter.start()
+        # Live searches answering autocomplete, typing fires one per keystroke
+        self._live_searches = commands.CooldownMapping.from_cooldown(
+            self.bot.config.get("autocomplete_live_rate", 1),
+            self.bot.config.get("autocomplete_live_per", 2),
+            commands.BucketType.guild,
+        )
+
+    async def cog_unload(self) -> None:
+        self.snapshotter.cancel()
 
     async def _establish_lava_node(self) -> None:
-        """Makes a connection to local lavalink node and adds to pomice's node pool"""
+        """Connects every Lavalink node from config.toml to pomice's node pool"""
         await self.bot.wait_until_ready()
-        await self.bot.node_pool.create_node(
-            bot=self.bot,
-            host="127.0.0.1",
-            port=2333,
-            password="youshallnotpass",
-            identifier="totoro-local",
-            spotify_client_id=self.bot.config.get("spotify_client_id"),
-            spotify_client_secret=self.bot.config.get("spotify_client_secret"),
+        with self.bot.startup_timer.phase("node connect"):
+            await self.bot.node_manager.connect_all()
+        await self.restore_players()
+
+    async def restore_players(self) -> None:
+        """Resume the players that were active before the last shutdown, all at once"""
+        snapshots, self.bot.pending_snapshots = self.bot.pending_snapshots, []
+        if not snapshots:
+            return
+        results = await asyncio.gather(
+            *[self._restore_player(s) for s in snapshots], return_exceptions=True
         )
+        for snapshot, result in zip(snapshots, results):
+            if isinstance(result, BaseException):
+                self.logger.warning(
+                    f"Failed to restore player for guild {snapshot['guild_id']}: {result}"
+                )
+        restored = sum(result is True for result in results)
+        self.logger.info(f"Restored {restored}/{len(snapshots)} players")
+
+    async def _restore_player(self, snapshot: dict) -> bool:
+        guild = self.bot.get_guild(snapshot["guild_id"])
+        channel = guild and guild.get_channel(snapshot["channel_id"])
+        if not channel or guild.voice_client:
+            return False
+        player: TotoroPlayer = await channel.connect(cls=TotoroPlayer, self_deaf=True)
+        await player.restore(snapshot)
+        return True
+
+    @tasks.loop(seconds=30)
+    async def snapshotter(self):
+        await self.bot.snapshot_players()
+        await self.bot.save_track_index()
 
-    def convert_time(self, length: int) -> str:
-        """Convert seconds/milliseconds to formatted timedelta object"""
-        return humanize_timedelta(timedelta(milliseconds=length))
+    @snapshotter.before_loop
+    async def before_snapshotter(self):
+        await self.bot.wait_until_ready()
+
+    async def play_next(self, player: TotoroPlayer, *, repeat: bool = True) -> None:
+        """Play the next playable track in queue. If none, player will be destroyed"""
+        while True:
+            try:
+                track = player.queue.get(repeat=repeat)
+            except pomice.QueueEmpty:
+                await player.disconnect()
+                await self.bot.storage.delete_snapshot(player.guild.id)
+                return
+            try:
+                await player.play(track)
+                return
+            except pomice.TrackLoadError:
+                repeat = False  # Dead track, move on to the one after it
+
+    @commands.Cog.listener("on_pomice_track_start")
+    async def track_start(self, player: TotoroPlayer, track):
+        """Resolve the upcoming tracks while this one plays"""
+        player.prefetch()
+        self.bot.track_index.add(
+            track.uri, track.title, track.author, guild_id=player.guild.id
+        )
 
     @commands.Cog.listener("on_pomice_track_end")
-    async def track_end(self, player: TotoroPlayer, track, _):
+    async def track_end(self, player: TotoroPlayer, track, reason):
         """Plays next song in queue. If none, player will be destroyed"""
-        try:
-            await player.play(player.queue.get())
-        except pomice.QueueEmpty:
-            await player.disconnect()
+        if reason.lower() == "replaced":  # Something else already started playing
+            return
+        # A skipped track shouldn't be repeated by track looping
+        await self.play_next(player, repeat=reason.lower() != "stopped")
 
     @commands.Cog.listener("on_pomice_track_stuck")
     async def track_stuck(self, player: TotoroPlayer, track, _):
         """Plays next song in queue if the previous one got stick. If none, player will be destroyed"""
-        try:
-            await player.play(player.queue.get())
-        except pomice.QueueEmpty:
-            await player.disconnect()
+        await self.play_next(player, repeat=False)
 
     @commands.command()
     async def connect(self, ctx: commands.Context):
@@ -115,12 +550,34 @@ class Music(commands.Cog):
         await ctx.send(f":white_check_mark: Joined channel {channel.name}")
 
     @commands.command()
+    async def resume(self, ctx: commands.Context):
+        """Bring back the queue of a player that was disconnected for being idle"""
+        if not ctx.author.voice:
+            return await ctx.send(
+                ":x: You're not in a Voice Channel. Join one and try again."
+            )
+        if ctx.voice_client:
+            return await ctx.send("There is an active player already in this guild")
+        snapshot = await self.bot.storage.load_snapshot(ctx.guild.id)
+        if not snapshot or not snapshot["reaped"]:
+            return await ctx.send("There is nothing to resume")
+        player: TotoroPlayer = await ctx.author.voice.channel.connect(
+            cls=TotoroPlayer, self_deaf=True
+        )
+        await player.restore({**snapshot, "paused": False})
+        if not player.current:
+            await self.play_next(player)
+        await ctx.send(f"Resumed with {len(player.queue)} tracks in queue")
+
+    @commands.hybrid_command()
+    @app_commands.describe(query="What to search for, pick a suggestion to play it right away")
     async def play(self, ctx: commands.Context, *, query: str):
         """Play a song through the bot"""
         if not ctx.author.voice:
             return await ctx.send(
                 ":x: You're not in a Voice Channel. Join one and try again."
             )
+        await ctx.defer()  # Searching can take longer than an interaction may wait
         if not ctx.voice_client:
             await ctx.author.voice.channel.connect(cls=TotoroPlayer, self_deaf=True)
         player: TotoroPlayer = ctx.voice_client
@@ -128,21 +585,26 @@ class Music(commands.Cog):
         if not tracks:
             return await ctx.send(":x: No tracks found with that query")
         if isinstance(tracks, pomice.Playlist):
-            for track in tracks.tracks:
-                player.queue.put(track)
             msg = await ctx.send(
-                f":scroll: Enqueued {tracks.track_count} tracks to the queue"
+                f":scroll: Enqueueing {tracks.track_count} tracks to the queue..."
             )
-            if not player.current:
-                track = player.queue.get()
-                await player.play(track)
-                await msg.reply(f":notes: Now playing {track.title}")
+            ingestion = PlaylistIngestion(
+                player,
+                tracks,
+                msg,
+                workers=self.bot.config.get("playlist_ingest_workers", 4),
+            )
+            player.create_task(ingestion.run())
             return
         if len(tracks) == 1:
             track = tracks[0]
-            player.queue.put(track)
+            try:
+                player.queue.put(track)
+            except pomice.QueueFull:
+                return await ctx.send(":x: The queue is full")
             if not player.current:
                 await player.play(player.queue.get())
+            player.prefetch()
             return await ctx.send(f":scroll: Enqueued {track.title}")
         await ctx.send(
             embed=discord.Embed(
@@ -155,82 +617,398 @@ class Music(commands.Cog):
             view=SelectorView().add_item(TotoroTrackSelector(ctx, tracks)),
         )
 
+    @play.autocomplete("query")
+    async def play_autocomplete(
+        self, inter: discord.Interaction, current: str
+    ) -> list[app_commands.Choice[str]]:
+        """Suggest tracks from the local index, searching Lavalink when it knows too few"""
+        tracks = self.bot.track_index.search(current, guild_id=inter.guild_id)
+        if (
+            len(tracks) < 5
+            and len(current) >= 3
+            and not current.startswith(("http://", "https://"))
+            and not self._live_searches.get_bucket(inter).update_rate_limit()
+        ):
+            known = {track.uri for track in tracks}
+            tracks += [t for t in await self._live_search(current) if t.uri not in known]
+        return [
+            app_commands.Choice(name=f"{track.title} - {track.author}"[:100], value=track.uri)
+            for track in tracks[:25]
+            if len(track.uri) <= 100
+        ]
+
+    async def _live_search(self, query: str) -> list[IndexedTrack]:
+        """Search Lavalink within the autocomplete deadline, adding the results to the index"""
+        search_type = pomice.SearchType.ytsearch
+        try:
+            node = self.bot.node_manager.select_node()
+            # Goes through the track cache so picking a result doesn't search again
+            result = await asyncio.wait_for(
+                self.bot.track_cache.get_or_fetch(
+                    (normalize_query(query), str(search_type)),
+                    lambda: node.get_tracks(query, search_type=search_type),
+                ),
+                self.bot.config.get("autocomplete_live_timeout", 1.5),
+            )
+        except (asyncio.TimeoutError, pomice.PomiceException):
+            return []  # The search keeps running and will be cached for next time
+        if not isinstance(result, list):
+            return []
+        for track in result:
+            # Weighted low so searches never outrank tracks people actually played
+            self.bot.track_index.add(track.uri, track.title, track.author, weight=0.1)
+            # Picking a suggestion plays its URI, which is then already resolved
+            self.bot.track_cache.put((normalize_query(track.uri), str(search_type)), [track])
+        return [IndexedTrack(t.uri, t.title, t.author) for t in result if t.uri]
+
+    @commands.command()
+    async def nodes(self, ctx: commands.Context):
+        """Show the load on each Lavalink node"""
+        manager = self.bot.node_manager
+        if not manager.nodes:
+            return await ctx.send("There are no Lavalink nodes connected")
+        embed = discord.Embed(title="Lavalink Nodes", color=discord.Color.green())
+        for ident, node in manager.nodes.items():
+            stats = getattr(node, "stats", None)
+            lines = [
+                f"Status: {'connected' if node.is_connected else 'disconnected'}",
+                f"Players: {node.player_count}",
+                f"Penalty: {node_penalty(node):.1f}",
+            ]
+            if stats is not None:
+                lines += [
+                    f"Playing: {stats.players_active}",
+                    f"CPU: {(stats.cpu_system_load or 0) * 100:.1f}% system | "
+                    f"{(stats.cpu_process_load or 0) * 100:.1f}% lavalink",
+                    f"Memory: {(stats.used or 0) // 1024**2}/{(stats.allocated or 0) // 1024**2} MiB",
+                ]
+            if regions := manager.regions.get(ident):
+                lines.append(f"Regions: {', '.join(sorted(regions))}")
+            embed.add_field(name=f"`{ident}`", value="\n".join(lines))
+        await ctx.send(embed=embed)
+
+    @commands.command(aliases=["cache"])
+    @commands.is_owner()
+    async def cachestats(self, ctx: commands.Context):
+        """Show how the shared track cache is performing"""
+        stats = self.bot.track_cache.stats
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups * 100 if lookups else 0
+        await ctx.send(
+            embed=discord.Embed(
+                title="Track Cache",
+                description="\n".join(f"{k}: {v}" for k, v in stats.items()),
+                color=discord.Color.green(),
+            ).set_footer(text=f"Hit rate: {hit_rate:.1f}%")
+        )
+
     @commands.command()
     async def disconnect(self, ctx: commands.Context):
         """Disconnect the current voice player"""
         player: TotoroPlayer = ctx.voice_client
         if player:
             await player.disconnect()
+            await self.bot.storage.delete_snapshot(ctx.guild.id)
             return
         await ctx.send("No active player")
 
     @commands.command(aliases=["next"])
+    @commands.cooldown(3, 5, commands.BucketType.member)
     async def skip(self, ctx: commands.Context):
         """Skip the current song"""
         player: TotoroPlayer = ctx.voice_client
         if player:
-            await player.stop()
+            # Skips sent in quick succession are merged into a single skip of several tracks
+            action, joined = player.actions.submit(
+                "skip", 1, player.skip_tracks, merge=operator.add
+            )
+            if joined:
+                return
+            skipped = await action.future
+            if skipped > 1:
+                await ctx.send(f"Skipped {skipped} tracks")
             if player.current:
                 await ctx.send(f"Now playing {player.current.title}")
             return
         await ctx.send("No active player")
 
     @commands.command()
+    @commands.cooldown(3, 5, commands.BucketType.member)
     async def pause(self, ctx: commands.Context):
         """Toggle the pause setting on the current player"""
         player: TotoroPlayer = ctx.voice_client
         if player:
-            await player.set_pause(not player.is_paused)
+            action, joined = player.actions.submit(
+                "pause", 1, player.toggle_pause, merge=operator.add
+            )
+            if not joined:
+                await action.future
             return
         await ctx.send("No active player")
 
     @commands.command()
+    @commands.cooldown(5, 10, commands.BucketType.member)
     async def volume(self, ctx: commands.Context, volume: int):
         if volume < 0 or volume > 100:
             return await ctx.send("Volume range must be within 0 and 100")
         player: TotoroPlayer = ctx.voice_client
-        await player.set_volume(volume)
-        await ctx.send(f"Set player volume to {volume}")
+        if not player:
+            return await ctx.send("No active player")
+        # Only the last of several volume changes in a row is sent to Lavalink
+        action, joined = player.actions.submit(
+            "volume", volume, player.set_volume, merge=lambda _, new: new
+        )
+        if joined:
+            return
+        await ctx.send(f"Set player volume to {await action.future}")
+
+    @commands.group(name="filter", aliases=["filters"], invoke_without_command=True)
+    @commands.cooldown(5, 10, commands.BucketType.member)
+    async def filter_(self, ctx: commands.Context, *presets: str):
+        """Toggle audio filter presets, `t!filter off` removes them all"""
+        player: TotoroPlayer = ctx.voice_client
+        available = ", ".join(f"`{name}`" for name in FILTER_PRESETS)
+        if not presets:
+            active = ", ".join(player.filter_presets or ()) if player else ""
+            default = ", ".join(self.bot.guild_filters.get(ctx.guild.id, ()))
+            return await ctx.send(
+                f"Active: {active or 'none'} | Default: {default or 'none'}\n"
+                f"Presets: {available}"
+            )
+        if not player:
+            return await ctx.send("No active player")
+        off = [p.casefold() for p in presets] == ["off"]
+        toggled = set(canonical_presets(presets))
+        if not off and len(toggled) != len({p.casefold() for p in presets}):
+            return await ctx.send(f"Unknown preset, pick from {available}")
+
+        def change(active: tuple[str, ...]) -> tuple[str, ...]:
+            return () if off else canonical_presets(set(active) ^ toggled)
+
+        # Toggles sent in quick succession are combined and applied in one update
+        action, joined = player.actions.submit(
+            "filter",
+            change,
+            player.change_filter_presets,
+            merge=lambda first, then: lambda active: then(first(active)),
+        )
+        if joined:
+            return
+        active = await action.future
+        await ctx.send(f":control_knobs: Filters: {', '.join(active) or 'none'}")
+
+    @filter_.command(name="default")
+    @commands.has_guild_permissions(manage_guild=True)
+    async def filter_default(self, ctx: commands.Context, *presets: str):
+        """Set the presets every new player in this server starts with, or `off`"""
+        available = ", ".join(f"`{name}`" for name in FILTER_PRESETS)
+        chosen = canonical_presets(presets)
+        if [p.casefold() for p in presets] != ["off"] and (
+            not presets or len(chosen) != len({p.casefold() for p in presets})
+        ):
+            return await ctx.send(f"Pick presets from {available}, or `off`")
+        await self.bot.storage.save_guild_filters(ctx.guild.id, chosen)
+        if chosen:
+            self.bot.guild_filters[ctx.guild.id] = chosen
+        else:
+            self.bot.guild_filters.pop(ctx.guild.id, None)
+        player: TotoroPlayer = ctx.voice_client
+        if player and not player.filter_presets and chosen:
+            await player.set_filter_presets(chosen)
+        await ctx.send(f"Default filters: {', '.join(chosen) or 'none'}")
 
     @commands.command(aliases=["np"])
-    async def nowplaying(self, ctx: commands.Context):
+    async def nowplaying(self, ctx: commands.Context, live: Optional[Literal["live"]] = None):
+        """Show the current track, `t!np live` keeps the message up to date"""
         player: TotoroPlayer = ctx.voice_client
         if not player or not player.current:
             return await ctx.send(
                 "There is currently no player or current track playing"
             )
-        np = player.current
+        msg = await ctx.send(embed=player.display.now_playing())
+        if live:
+            player.display.show_live(msg, player.create_task)
+
+    @commands.command()
+    async def queue(self, ctx: commands.Context):
+        player: TotoroPlayer = ctx.voice_client
+        if not player:
+            return await ctx.send("There is currently no player. No queue found.")
+        if player.queue.is_empty:
+            return await ctx.send("The queue is empty")
+
+        paginator = Paginator(player.display.queue_page, player.display.page_count)
+        await paginator.start(ctx)
+
+    @commands.command()
+    async def remove(self, ctx: commands.Context, position: int):
+        """Remove a track from the queue by its position"""
+        player: TotoroPlayer = ctx.voice_client
+        if not player:
+            return await ctx.send("No active player")
+        if position < 1:
+            return await ctx.send(f"Position must be within 1 and {len(player.queue)}")
+        try:
+            entry = player.queue.remove(position - 1)
+        except IndexError:
+            return await ctx.send(f"Position must be within 1 and {len(player.queue)}")
+        player.prefetch()
+        await ctx.send(f"Removed {entry.title} from the queue")
+
+    @commands.command()
+    async def move(self, ctx: commands.Context, position: int, to: int):
+        """Move a track in the queue to another position"""
+        player: TotoroPlayer = ctx.voice_client
+        if not player:
+            return await ctx.send("No active player")
+        if position < 1 or to < 1:
+            return await ctx.send(f"Position must be within 1 and {len(player.queue)}")
+        try:
+            entry = player.queue.move(position - 1, to - 1)
+        except IndexError:
+            return await ctx.send(f"Position must be within 1 and {len(player.queue)}")
+        player.prefetch()
+        await ctx.send(f"Moved {entry.title} to position {to}")
+
+    @commands.command()
+    async def shuffle(self, ctx: commands.Context):
+        """Shuffle the upcoming tracks"""
+        player: TotoroPlayer = ctx.voice_client
+        if not player:
+            return await ctx.send("No active player")
+        player.queue.shuffle()
+        player.prefetch()
+        await ctx.send(":twisted_rightwards_arrows: Shuffled the queue")
+
+    @commands.command()
+    async def dedupe(self, ctx: commands.Context):
+        """Remove duplicate tracks from the queue"""
+        player: TotoroPlayer = ctx.voice_client
+        if not player:
+            return await ctx.send("No active player")
+        removed = player.queue.dedupe()
+        await ctx.send(f"Removed {removed} duplicate tracks from the queue")
+
+    @commands.command()
+    async def loop(self, ctx: commands.Context, mode: str = "off"):
+        """Loop the current track or the whole queue. Modes: off, track, queue"""
+        player: TotoroPlayer = ctx.voice_client
+        if not player:
+            return await ctx.send("No active player")
+        if mode.lower() not in player.LOOP_MODES:
+            return await ctx.send("Loop mode must be one of: off, track, queue")
+        player.queue.set_loop_mode(player.LOOP_MODES[mode.lower()])
+        await ctx.send(f":repeat: Loop mode set to {mode.lower()}")
+
+    @commands.command()
+    async def history(self, ctx: commands.Context):
+        """Show the most recently played tracks"""
+        player: TotoroPlayer = ctx.voice_client
+        if not player or not player.queue.history:
+            return await ctx.send("No tracks have been played yet")
+        recent = list(reversed(player.queue.history))[:10]
         await ctx.send(
             embed=discord.Embed(
-                title=np.title,
-                description=f"from: {np.author}",
+                title="Recently Played",
+                description="\n".join(
+                    [f"{i}. {t.author} - {t.title}" for i, t in enumerate(recent, 1)]
+                ),
                 color=discord.Color.green(),
-                url=np.uri,
             )
-            .set_thumbnail(url=np.thumbnail)
-            .set_footer(text=f"ID: {np.identifier}")
-            .add_field(name="Requester", value=np.requester)
-            .add_field(name="Length", value=self.convert_time(np.length, "ms"))
-            .add_field(name="Filters", value=np.filters)
-            .add_field(name="Seekable", value=np.is_seekable)
         )
 
     @commands.command()
-    async def queue(self, ctx: commands.Context):
+    async def clear(self, ctx: commands.Context):
+        """Clear all upcoming tracks from the queue"""
         player: TotoroPlayer = ctx.voice_client
         if not player:
-            return await ctx.send("There is currently no player. No queue found.")
-        embeds = [
-            discord.Embed(
-                title=f"Page: {idx}",
-                description="\n".join([f"{t.author} - {t.title}" for t in page]),
-            )
-            for idx, page in enumerate(
-                chunk_iter(player.queue, 10), 1
-            )  # 10 Tracks per page
-        ]
-        paginator = Paginator(embeds)
-        await paginator.start(ctx)
+            return await ctx.send("No active player")
+        player.queue.clear()
+        await ctx.send("Cleared the queue")
+
+    @commands.group(aliases=["pl"], invoke_without_command=True)
+    async def playlist(self, ctx: commands.Context):
+        """Save the queue as a playlist and load it back later without searching"""
+        await ctx.invoke(self.playlist_list)
+
+    @playlist.command(name="save")
+    async def playlist_save(self, ctx: commands.Context, *, name: str):
+        """Save the current track and queue under a name"""
+        player: TotoroPlayer = ctx.voice_client
+        if not player or not (player.current or player.queue):
+            return await ctx.send("There is nothing playing to save")
+        if len(name) > 50:
+            return await ctx.send("Playlist names can be at most 50 characters")
+        saved = await self.bot.storage.list_playlists(ctx.author.id)
+        limit = self.bot.config.get("playlist_max_per_user", 25)
+        if len(saved) >= limit and name.casefold() not in {p["name"].casefold() for p in saved}:
+            return await ctx.send(f"You can only have {limit} playlists, delete one first")
+        entries = [QueueEntry.from_track(player.current)] if player.current else []
+        entries += list(player.queue)
+
+        async def playable(entry: QueueEntry) -> Optional[QueueEntry]:
+            if entry.playable:
+                return entry
+            track = await player.resolve(entry.to_track())
+            return track and QueueEntry.from_track(track.original)
+
+        # Resolve what hasn't been yet, so loading never has to search
+        workers = self.bot.config.get("playlist_ingest_workers", 4)
+        records = []
+        for start in range(0, len(entries), workers):
+            window = entries[start : start + workers]
+            resolved = await asyncio.gather(*[playable(entry) for entry in window])
+            records += [entry.to_record() for entry in resolved if entry]
+        await self.bot.storage.save_playlist(
+            ctx.author.id, name, json.dumps(records), len(records)
+        )
+        await ctx.send(f":floppy_disk: Saved {len(records)} tracks as playlist `{name}`")
+
+    @playlist.command(name="load", aliases=["play"])
+    async def playlist_load(self, ctx: commands.Context, *, name: str):
+        """Enqueue one of your saved playlists"""
+        if not ctx.author.voice:
+            return await ctx.send(
+                ":x: You're not in a Voice Channel. Join one and try again."
+            )
+        saved = await self.bot.storage.load_playlist(ctx.author.id, name)
+        if not saved:
+            return await ctx.send(f"You don't have a playlist called `{name}`")
+        if not ctx.voice_client:
+            await ctx.author.voice.channel.connect(cls=TotoroPlayer, self_deaf=True)
+        player: TotoroPlayer = ctx.voice_client
+        # Saved entries hold encoded Lavalink tracks, they play without any lookup
+        added = player.queue.put_many(
+            QueueEntry.from_record(record, ctx.author)
+            for record in json.loads(saved["tracks"])
+        )
+        if not player.current and player.queue:
+            await self.play_next(player)
+        player.prefetch()
+        await ctx.send(f":scroll: Added {added} tracks from playlist `{saved['name']}`")
+
+    @playlist.command(name="list")
+    async def playlist_list(self, ctx: commands.Context):
+        """Show your saved playlists"""
+        saved = await self.bot.storage.list_playlists(ctx.author.id)
+        if not saved:
+            return await ctx.send("You haven't saved any playlists yet, use `t!playlist save <name>`")
+        await ctx.send(
+            embed=discord.Embed(
+                title=f"{ctx.author.display_name}'s Playlists",
+                description="\n".join(
+                    f"`{p['name']}` - {p['track_count']} tracks" for p in saved
+                ),
+                color=discord.Color.green(),
+            )
+        )
+
+    @playlist.command(name="delete", aliases=["remove"])
+    async def playlist_delete(self, ctx: commands.Context, *, name: str):
+        """Delete one of your saved playlists"""
+        if await self.bot.storage.delete_playlist(ctx.author.id, name):
+            return await ctx.send(f"Deleted playlist `{name}`")
+        await ctx.send(f"You don't have a playlist called `{name}`")
 
 
 async def setup(bot: TotoroBot):
@@ -1,6 +1,9 @@
 import asyncio
 import logging
+import time
+from collections import Counter
 from itertools import cycle
+from typing import Optional
 
 import discord
 from core import TotoroBot
@@ -11,7 +14,22 @@ class Tasks(commands.Cog):
     def __init__(self, bot: TotoroBot):
         self.bot = bot
         self.logger = logging.getLogger(__name__)
+        # Seconds a player may stay idle for each reason, 0 never reaps for it
+        self.reap_after = {
+            "empty": self.bot.config.get("reap_empty_after", 120),
+            "paused": self.bot.config.get("reap_paused_after", 900),
+            "idle": self.bot.config.get("reap_idle_after", 300),
+        }
+        self._idle: dict[int, tuple[str, float]] = {}
         self.activity_cycler.start()
+        self.player_reaper.change_interval(
+            seconds=self.bot.config.get("reaper_interval", 30)
+        )
+        self.player_reaper.start()
+
+    async def cog_unload(self) -> None:
+        self.activity_cycler.cancel()
+        self.player_reaper.cancel()
 
     @tasks.loop()
     async def activity_cycler(self):
@@ -20,7 +38,7 @@ class Tasks(commands.Cog):
             discord.Activity(
                 type=discord.ActivityType.listening, name="to music with your mom"
             ),
-            discord.Game(f"with {len(self.bot.users)} users"),
+            discord.Game(f"with {self.bot.user_count()} users"),
         ]
         await self.bot.wait_until_ready()
         for act in cycle(activities):
@@ -28,6 +46,80 @@ class Tasks(commands.Cog):
             self.logger.debug(f"Changed bot activity to: {act}")
             await asyncio.sleep(360)
 
+    @staticmethod
+    def idle_reason(player) -> Optional[str]:
+        """Why a player isn't being used, None if it is"""
+        if not player.channel or not any(not m.bot for m in player.channel.members):
+            return "empty"
+        if player.is_paused:
+            return "paused"
+        if not player.current:
+            return "idle"  # Connected with t!connect but nothing played
+        return None
+
+    @tasks.loop(seconds=30)
+    async def player_reaper(self):
+        """Disconnect players that have been idle for longer than allowed"""
+        now = time.monotonic()
+        players = {
+            vc.guild.id: vc for vc in self.bot.voice_clients if hasattr(vc, "snapshot")
+        }
+        for guild_id in self._idle.keys() - players.keys():
+            del self._idle[guild_id]
+        due = []
+        for guild_id, player in players.items():
+            reason = self.idle_reason(player)
+            if not reason or not self.reap_after[reason]:
+                self._idle.pop(guild_id, None)
+                continue
+            idle = self._idle.get(guild_id)
+            if idle is None or idle[0] != reason:
+                self._idle[guild_id] = (reason, now)
+            elif now - idle[1] >= self.reap_after[reason]:
+                due.append((player, reason))
+        if due:
+            await self.reap(due)
+
+    @player_reaper.before_loop
+    async def before_player_reaper(self):
+        await self.bot.wait_until_ready()
+
+    async def reap(self, due: list[tuple]) -> None:
+        # Save the queues first so they can be brought back with t!resume
+        snapshots = [s for s in (player.snapshot() for player, _ in due) if s]
+        if snapshots:
+            try:
+                await self.bot.storage.save_snapshots(snapshots, reaped=True)
+            except Exception as e:
+                self.logger.error(f"Failed to snapshot idle players, not reaping them: {e}")
+                return
+        reasons: Counter[str] = Counter()
+        nodes: Counter[str] = Counter()
+        tracks = 0
+        held = [len(player.queue) + bool(player.current) for player, _ in due]
+        results = await asyncio.gather(
+            *[player.disconnect() for player, _ in due], return_exceptions=True
+        )
+        for (player, reason), queued, result in zip(due, held, results):
+            self._idle.pop(player.guild.id, None)
+            if isinstance(result, Exception):
+                self.logger.error(
+                    f"Failed to reap player in guild {player.guild.id}: {result}"
+                )
+                continue
+            reasons[reason] += 1
+            nodes[player.node._identifier] += 1
+            tracks += queued
+        self.bot.metrics.players_reaped.update(reasons)
+        self.bot.metrics.reaped_tracks += tracks
+        if reasons:
+            self.logger.info(
+                f"Reaped {sum(reasons.values())} idle players "
+                f"({', '.join(f'{count} {reason}' for reason, count in reasons.items())}), "
+                f"freed {tracks} queued tracks and Lavalink players on "
+                f"{', '.join(f'{node}: {count}' for node, count in nodes.items())}"
+            )
+
 
 async def setup(bot: TotoroBot):
     await bot.add_cog(Tasks(bot))
@@ -1 +1,6 @@
+from .cluster import *
+from .logs import *
+from .metrics import *
+from .nodes import *
+from .profiling import *
 from .totoro import *
@@ -0,0 +1,243 @@
+"""Cluster mode, spreading shards over several processes
+
+The supervisor process asks Discord how many shards to run, splits them into
+`clusters` contiguous ranges and starts one TotoroBot process per range. A
+cluster that crashes is restarted with exponential backoff, a cluster that
+exits cleanly (t!logout) is left stopped.
+
+Clusters talk to each other through the supervisor over a local TCP socket
+carrying newline delimited JSON:
+
+    cluster    -> supervisor  {"op": "identify", "cluster": 0}
+    cluster    -> supervisor  {"op": "broadcast", "id": 1, "method": "stats"}
+    supervisor -> clusters    {"op": "call", "id": 7, "method": "stats"}
+    clusters   -> supervisor  {"op": "reply", "id": 7, "data": {...}}
+    supervisor -> cluster     {"op": "result", "id": 1, "data": [{...}, ...]}
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+import discord
+
+if TYPE_CHECKING:
+    from .totoro import TotoroBot
+
+CLUSTER_ENV = "TOTORO_CLUSTER"
+
+
+def split_shards(shard_count: int, clusters: int) -> list[list[int]]:
+    """Split shard IDs into contiguous, evenly sized ranges"""
+    clusters = max(1, min(clusters, shard_count))
+    size, extra = divmod(shard_count, clusters)
+    ranges, start = [], 0
+    for i in range(clusters):
+        end = start + size + (i < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def cluster_from_env() -> Optional[dict[str, Any]]:
+    """Cluster settings handed to a worker process by the supervisor"""
+    raw = os.environ.get(CLUSTER_ENV)
+    return json.loads(raw) if raw else None
+
+
+async def _send(writer: asyncio.StreamWriter, payload: dict[str, Any]) -> None:
+    writer.write(json.dumps(payload).encode() + b"\n")
+    await writer.drain()
+
+
+class ClusterSupervisor:
+    """Starts and restarts cluster processes and routes IPC between them"""
+
+    MAX_RESTART_DELAY = 60
+    STABLE_AFTER = 120  # Seconds a cluster has to stay up for its backoff to reset
+    CALL_TIMEOUT = 2
+
+    def __init__(self, token: str, clusters: int, shard_count: Optional[int] = None):
+        self.logger = logging.getLogger(__name__)
+        self.token = token
+        self.clusters = clusters
+        self.shard_count = shard_count
+        self.processes: dict[int, asyncio.subprocess.Process] = {}
+        self.writers: dict[int, asyncio.StreamWriter] = {}
+        self._calls: dict[int, dict[int, asyncio.Future]] = {}
+        self._call_ids = itertools.count(1)
+        self._closing = False
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def _fetch_shard_count(self) -> int:
+        http = discord.http.HTTPClient(asyncio.get_running_loop())
+        try:
+            await http.static_login(self.token)
+            shards, _, _ = await http.get_bot_gateway()
+            return shards
+        finally:
+            await http.close()
+
+    async def run(self) -> None:
+        shard_count = self.shard_count or await self._fetch_shard_count()
+        ranges = split_shards(shard_count, self.clusters)
+        self._server = await asyncio.start_server(self._handle_cluster, "127.0.0.1", 0)
+        address = self._server.sockets[0].getsockname()
+        self.logger.info(
+            f"Running {shard_count} shards in {len(ranges)} clusters, IPC on {address[0]}:{address[1]}"
+        )
+        if os.name != "nt":
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, self.stop)
+        await asyncio.gather(
+            *(
+                self._supervise(
+                    {"id": i, "shards": shards, "shard_count": shard_count, "ipc": list(address)}
+                )
+                for i, shards in enumerate(ranges)
+            )
+        )
+        self._server.close()
+        self.logger.info("Every cluster has stopped")
+
+    def stop(self) -> None:
+        self._closing = True
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.terminate()
+
+    async def _supervise(self, cluster: dict[str, Any]) -> None:
+        failures = 0
+        while not self._closing:
+            env = {**os.environ, CLUSTER_ENV: json.dumps(cluster)}
+            started = time.monotonic()
+            process = await asyncio.create_subprocess_exec(sys.executable, sys.argv[0], env=env)
+            self.processes[cluster["id"]] = process
+            self.logger.info(
+                f"Cluster {cluster['id']} started (PID {process.pid}, shards "
+                f"{cluster['shards'][0]}-{cluster['shards'][-1]})"
+            )
+            code = await process.wait()
+            if self._closing or code == 0:
+                self.logger.info(f"Cluster {cluster['id']} stopped")
+                return
+            failures = 1 if time.monotonic() - started > self.STABLE_AFTER else failures + 1
+            delay = min(self.MAX_RESTART_DELAY, 2 ** (failures - 1))
+            self.logger.warning(
+                f"Cluster {cluster['id']} exited with code {code}, restarting in {delay}s"
+            )
+            await asyncio.sleep(delay)
+
+    async def _handle_cluster(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        cluster_id = None
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                op = message["op"]
+                if op == "identify":
+                    cluster_id = message["cluster"]
+                    self.writers[cluster_id] = writer
+                elif op == "broadcast":
+                    asyncio.create_task(self._broadcast(writer, message))
+                elif op == "reply":
+                    future = self._calls.get(message["id"], {}).get(cluster_id)
+                    if future and not future.done():
+                        future.set_result(message["data"])
+        except (ConnectionError, json.JSONDecodeError) as e:
+            self.logger.warning(f"Dropped IPC connection of cluster {cluster_id}: {e}")
+        finally:
+            if self.writers.get(cluster_id) is writer:
+                del self.writers[cluster_id]
+            writer.close()
+
+    async def _broadcast(self, requester: asyncio.StreamWriter, message: dict[str, Any]) -> None:
+        call_id = next(self._call_ids)
+        loop = asyncio.get_running_loop()
+        calls = self._calls[call_id] = {cid: loop.create_future() for cid in self.writers}
+        for cid, writer in list(self.writers.items()):
+            try:
+                await _send(writer, {"op": "call", "id": call_id, "method": message["method"]})
+            except ConnectionError:
+                calls.pop(cid).cancel()
+        if calls:
+            await asyncio.wait(calls.values(), timeout=self.CALL_TIMEOUT)
+        del self._calls[call_id]
+        results = [f.result() for f in calls.values() if f.done() and not f.cancelled()]
+        try:
+            await _send(requester, {"op": "result", "id": message["id"], "data": results})
+        except ConnectionError:
+            pass
+
+
+class ClusterClient:
+    """A cluster's connection to the supervisor"""
+
+    def __init__(self, bot: "TotoroBot", cluster: dict[str, Any]):
+        self.bot = bot
+        self.logger = logging.getLogger(__name__)
+        self.id: int = cluster["id"]
+        self.shard_ids: list[int] = cluster["shards"]
+        self.shard_count: int = cluster["shard_count"]
+        self.address: tuple[str, int] = tuple(cluster["ipc"])
+        self.handlers: dict[str, Callable[[], Any]] = {"stats": bot.cluster_stats}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._results: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+
+    async def connect(self) -> None:
+        reader, self._writer = await asyncio.open_connection(*self.address)
+        await _send(self._writer, {"op": "identify", "cluster": self.id})
+        self._reader_task = asyncio.create_task(self._read(reader))
+        if os.name != "nt":  # Let the supervisor stop us gracefully so players are snapshotted
+            main = asyncio.current_task()
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, lambda: asyncio.create_task(self._terminate(main))
+            )
+
+    async def _terminate(self, main: asyncio.Task) -> None:
+        await self.bot.close()
+        main.cancel()  # Shards still waiting to identify would otherwise keep retrying
+
+    async def close(self) -> None:
+        if self._reader_task:
+            self._reader_task.cancel()
+        if self._writer:
+            self._writer.close()
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        while line := await reader.readline():
+            message = json.loads(line)
+            if message["op"] == "call":
+                asyncio.create_task(self._answer(message))
+            elif message["op"] == "result":
+                future = self._results.pop(message["id"], None)
+                if future and not future.done():
+                    future.set_result(message["data"])
+        self.logger.warning("Lost the IPC connection to the cluster supervisor")
+
+    async def _answer(self, message: dict[str, Any]) -> None:
+        handler = self.handlers.get(message["method"])
+        data = handler() if handler else None
+        if asyncio.iscoroutine(data):
+            data = await data
+        await _send(self._writer, {"op": "reply", "id": message["id"], "data": data})
+
+    async def broadcast(self, method: str, *, timeout: float = 3) -> list[Any]:
+        """Call a handler on every cluster, including this one, and collect the results"""
+        call_id = next(self._ids)
+        future = self._results[call_id] = asyncio.get_running_loop().create_future()
+        await _send(self._writer, {"op": "broadcast", "id": call_id, "method": method})
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._results.pop(call_id, None)
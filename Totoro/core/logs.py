@@ -0,0 +1,161 @@
+"""Logging that never blocks the event loop
+
+Records are put on a queue by the logging calls and formatted and written by
+a QueueListener on a background thread, tracebacks included. Repeated
+warnings and errors are sampled so a burst of the same failure can't flood
+the queue. Configured with the [logging] table in config.toml:
+
+    [logging]
+    level = "INFO"
+    json = false            # One JSON object per line instead of coloured text
+    file = "totoro.log"     # Also write to a rotating file
+    sample_burst = 5        # Identical errors logged per window before sampling
+    sample_window = 60
+
+    [logging.levels]
+    "discord.gateway" = "WARNING"
+
+Extra fields passed with `extra=` (guild, shard, command, latency, ...) end
+up as keys of the JSON events, command_fields() builds them for a command.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import discord
+from discord.ext import commands
+
+# Attributes every LogRecord has, anything else was passed through `extra`
+_RECORD_ATTRS = frozenset(
+    logging.LogRecord("", 0, "", 0, "", (), None).__dict__
+) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def command_fields(ctx: commands.Context, **extra: Any) -> dict[str, Any]:
+    """Structured fields describing a command invocation"""
+    return {
+        "guild": ctx.guild and ctx.guild.id,
+        "shard": ctx.guild and ctx.guild.shard_id,
+        "command": ctx.command and ctx.command.qualified_name,
+        "user": ctx.author.id,
+        **extra,
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single line JSON events"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        event.update(
+            (key, value)
+            for key, value in record.__dict__.items()
+            if key not in _RECORD_ATTRS
+        )
+        if record.exc_info:
+            event["exception"] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str)
+
+
+class ErrorSampler(logging.Filter):
+    """Lets `burst` warnings or errors from one call site through per window, then counts them
+
+    Records are told apart by where they were logged and their exception type,
+    not by their message, which f-strings make different every time.
+
+    The first record let through after sampling kicked in carries how many
+    were dropped in a `suppressed` field.
+    """
+
+    def __init__(self, *, burst: int = 5, window: float = 60):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._seen: dict[tuple, list] = {}  # key -> [window start, count, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or not self.burst:
+            return True
+        exc = record.exc_info[0] if record.exc_info else None
+        key = (record.pathname, record.lineno, exc)
+        now = time.monotonic()
+        seen = self._seen.get(key)
+        if seen is None or now - seen[0] >= self.window:
+            if len(self._seen) > 1000:  # Don't grow forever on unique messages
+                self._seen.clear()
+            suppressed = seen[2] if seen else 0
+            self._seen[key] = [now, 1, 0]
+            if suppressed:
+                record.suppressed = suppressed
+            return True
+        seen[1] += 1
+        if seen[1] > self.burst:
+            seen[2] += 1
+            return False
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock handler formats the record, traceback and all, on the calling
+        # thread. Only merge the arguments and leave the rest to the listener.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(config: Any) -> None:
+    """Route every log record through a queue to handlers on a background thread"""
+    global _listener
+    if _listener is not None:
+        return
+    settings = config.get("logging", {})
+    if settings.get("json", False):
+        formatter: logging.Formatter = JsonFormatter()
+    elif discord.utils.stream_supports_colour(sys.stderr):
+        formatter = discord.utils._ColourFormatter()
+    else:
+        formatter = logging.Formatter(
+            "[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{"
+        )
+    handlers: list[logging.Handler] = [logging.StreamHandler()]
+    if settings.get("file"):
+        handlers.append(
+            logging.handlers.RotatingFileHandler(
+                settings["file"], maxBytes=32 * 1024**2, backupCount=5, encoding="utf-8"
+            )
+        )
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    handler = _QueueHandler(queue.SimpleQueue())
+    handler.addFilter(
+        ErrorSampler(
+            burst=settings.get("sample_burst", 5), window=settings.get("sample_window", 60)
+        )
+    )
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.get("level", "INFO"))
+    for name, level in settings.get("levels", {}).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(
+        handler.queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(_listener.stop)  # Flushes whatever is still queued
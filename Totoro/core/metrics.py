@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, defaultdict
+from typing import TYPE_CHECKING, Optional
+
+from aiohttp import web
+from discord.ext import commands
+
+if TYPE_CHECKING:
+    from .totoro import TotoroBot
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process, None where /proc isn't available"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Histogram:
+    """Fixed bucket histogram, cumulative like Prometheus expects"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "max")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile, as the upper bound of the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= rank:
+                return bound
+        return self.max
+
+
+class TotoroMetrics:
+    """Collects command, event loop and Lavalink metrics for t!stats and Prometheus"""
+
+    def __init__(self, bot: "TotoroBot"):
+        self.bot = bot
+        self.logger = logging.getLogger(__name__)
+        self.command_latency: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.command_errors: Counter[str] = Counter()
+        self.loop_lag = Histogram(LAG_BUCKETS)
+        self.players_reaped: Counter[str] = Counter()
+        self.reaped_tracks = 0
+        self._lag_task: Optional[asyncio.Task] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    def command_started(self, ctx: commands.Context) -> None:
+        ctx.metrics_started = time.perf_counter()
+
+    def command_finished(
+        self, ctx: commands.Context, *, failed: bool = False
+    ) -> Optional[float]:
+        """Record a finished command, returns how long it took in seconds"""
+        name = ctx.command.qualified_name if ctx.command else "unknown"
+        started = getattr(ctx, "metrics_started", None)
+        latency = None
+        if started is not None:
+            latency = time.perf_counter() - started
+            self.command_latency[name].observe(latency)
+        if failed:
+            self.command_errors[name] += 1
+        return latency
+
+    async def _sample_loop_lag(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag.observe(max(0.0, loop.time() - before - interval))
+
+    async def start(self) -> None:
+        """Start sampling loop lag and serve /metrics if a port is configured"""
+        self._lag_task = asyncio.create_task(
+            self._sample_loop_lag(self.bot.config.get("loop_lag_interval", 0.5))
+        )
+        port = self.bot.config.get("metrics_port")
+        if not port:
+            return
+        if self.bot.cluster:  # Every cluster process serves its own metrics
+            port += self.bot.cluster.id
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        host = self.bot.config.get("metrics_host", "127.0.0.1")
+        await web.TCPSite(self._runner, host, port).start()
+        self.logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def close(self) -> None:
+        if self._lag_task:
+            self._lag_task.cancel()
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _handle_metrics(self, _: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain")
+
+    def players(self) -> list:
+        return [vc for vc in self.bot.voice_clients if hasattr(vc, "queue")]
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP totoro_{name} {help_text}")
+            lines.append(f"# TYPE totoro_{name} {kind}")
+
+        def histogram(name: str, hist: Histogram, labels: str = "") -> None:
+            sep = "," if labels else ""
+            for bound, count in zip(hist.buckets, hist.counts):
+                lines.append(f'totoro_{name}_bucket{{{labels}{sep}le="{bound}"}} {count}')
+            lines.append(f'totoro_{name}_bucket{{{labels}{sep}le="+Inf"}} {hist.count}')
+            lines.append(f"totoro_{name}_sum{{{labels}}} {hist.sum}")
+            lines.append(f"totoro_{name}_count{{{labels}}} {hist.count}")
+
+        metric("command_latency_seconds", "histogram", "Command invocation latency")
+        for name, hist in self.command_latency.items():
+            histogram("command_latency_seconds", hist, f'command="{name}"')
+        metric("command_errors_total", "counter", "Commands that raised an error")
+        for name, count in self.command_errors.items():
+            lines.append(f'totoro_command_errors_total{{command="{name}"}} {count}')
+        metric("event_loop_lag_seconds", "histogram", "Event loop scheduling lag")
+        histogram("event_loop_lag_seconds", self.loop_lag)
+
+        metric("shard_latency_seconds", "gauge", "Gateway heartbeat latency per shard")
+        for shard_id, latency in self.bot.latencies:
+            lines.append(f'totoro_shard_latency_seconds{{shard="{shard_id}"}} {latency}')
+        metric("guilds", "gauge", "Guilds the bot is in")
+        lines.append(f"totoro_guilds {len(self.bot.guilds)}")
+
+        players = self.players()
+        metric("players", "gauge", "Connected voice players")
+        lines.append(f"totoro_players {len(players)}")
+        metric("queued_tracks", "gauge", "Tracks waiting in all player queues")
+        lines.append(f"totoro_queued_tracks {sum(len(p.queue) for p in players)}")
+        metric("players_reaped_total", "counter", "Idle players disconnected by the reaper")
+        for reason, count in self.players_reaped.items():
+            lines.append(f'totoro_players_reaped_total{{reason="{reason}"}} {count}')
+        metric("reaped_tracks_total", "counter", "Queued tracks released by reaped players")
+        lines.append(f"totoro_reaped_tracks_total {self.reaped_tracks}")
+
+        metric("track_cache", "gauge", "Track cache counters")
+        for key, value in self.bot.track_cache.stats.items():
+            lines.append(f'totoro_track_cache{{stat="{key}"}} {value}')
+
+        metric("lavalink_node", "gauge", "Lavalink node stats")
+        for ident, node in self.bot.node_pool.nodes.items():
+            values = {"connected": int(node.is_connected), "players": node.player_count}
+            stats = getattr(node, "stats", None)
+            if stats is not None:
+                values.update(
+                    playing=stats.players_active or 0,
+                    cpu_system_load=stats.cpu_system_load or 0,
+                    cpu_lavalink_load=stats.cpu_process_load or 0,
+                    memory_used_bytes=stats.used or 0,
+                    memory_allocated_bytes=stats.allocated or 0,
+                )
+            for key, value in values.items():
+                lines.append(f'totoro_lavalink_node{{node="{ident}",stat="{key}"}} {value}')
+
+        if (rss := rss_bytes()) is not None:
+            metric("resident_memory_bytes", "gauge", "Resident set size")
+            lines.append(f"totoro_resident_memory_bytes {rss}")
+        return "\n".join(lines) + "\n"
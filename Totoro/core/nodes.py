@@ -0,0 +1,283 @@
+import asyncio
+import json
+import logging
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Optional
+
+import pomice
+from websockets import exceptions
+
+if TYPE_CHECKING:
+    from .totoro import TotoroBot
+
+DEFAULT_NODE = {
+    "identifier": "totoro-local",
+    "host": "127.0.0.1",
+    "port": 2333,
+    "password": "youshallnotpass",
+}
+
+
+def node_penalty(node: pomice.Node) -> float:
+    """Score how loaded a node is, lower is better
+
+    Modeled after Lavalink's own load balancing penalties. Player count comes
+    from our side since node stats are only pushed about once a minute.
+    Frame deficit stats aren't exposed by pomice so they're only used if present.
+    """
+    penalty = float(node.player_count)
+    stats = getattr(node, "stats", None)  # Not set until the first stats payload
+    if stats is None:
+        return penalty
+    penalty = max(penalty, float(stats.players_active or 0))
+    penalty += 1.05 ** (100 * (stats.cpu_system_load or 0)) * 10 - 10
+    deficit = getattr(stats, "frames_deficit", None)
+    nulled = getattr(stats, "frames_nulled", None)
+    if deficit is not None and nulled is not None:
+        penalty += 1.03 ** (500 * (deficit / 3000)) * 600 - 600
+        penalty += (1.03 ** (500 * (nulled / 3000)) * 300 - 300) * 2
+    return penalty
+
+
+class TotoroNode(pomice.Node):
+    """pomice.Node that reports a dropped connection to the node manager
+
+    pomice destroys every player of a node whose websocket closes, this hands
+    them to TotoroNodeManager instead so they can be moved to another node.
+    """
+
+    def __init__(self, *, manager: "TotoroNodeManager", **kwargs: Any):
+        super().__init__(**kwargs)
+        self.manager = manager
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                msg = await self._websocket.recv()
+            except exceptions.ConnectionClosed:
+                break
+            self._loop.create_task(self._handle_ws_msg(data=json.loads(msg)))
+        self.manager.node_lost(self)
+
+
+class TotoroNodeManager:
+    """Connects the Lavalink nodes declared in config.toml and picks nodes for new players
+
+    Connected nodes are pinged every `node_health_interval` seconds. When a
+    node drops or stops answering, its players are migrated to the healthiest
+    remaining node and it is reconnected with exponential backoff. Players
+    left without any node wait for the first one to come back.
+    """
+
+    def __init__(self, bot: "TotoroBot"):
+        self.bot = bot
+        self.logger = logging.getLogger(__name__)
+        self.health_interval = bot.config.get("node_health_interval", 5)
+        self.health_timeout = bot.config.get("node_health_timeout", 3)
+        self.reconnect_delay = bot.config.get("node_reconnect_delay", 1)
+        self.max_reconnect_delay = bot.config.get("node_max_reconnect_delay", 60)
+        self._tasks: set[asyncio.Task] = set()
+        self._migrating = asyncio.Lock()
+        self._closing = False
+        self.node_configs: list[dict[str, Any]] = [
+            {**DEFAULT_NODE, **node}
+            for node in bot.config.get("lavalink_nodes", [DEFAULT_NODE])
+        ]
+        self.regions: dict[str, frozenset[str]] = {
+            node["identifier"]: frozenset(node.get("regions", ()))
+            for node in self.node_configs
+        }
+
+    @property
+    def nodes(self) -> dict[str, pomice.Node]:
+        return self.bot.node_pool.nodes
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def connect_all(self) -> None:
+        """Connect every configured node concurrently, retrying failed ones in the background"""
+        results = await asyncio.gather(
+            *[self._create_node(node) for node in self.node_configs],
+            return_exceptions=True,
+        )
+        for node, result in zip(self.node_configs, results):
+            if isinstance(result, BaseException):
+                self.logger.warning(
+                    f"Lavalink node {node['identifier']}... failure: {result}"
+                )
+                self._spawn(self._reconnect(node))
+            else:
+                self.logger.info(f"Lavalink node {node['identifier']}... success")
+        self._spawn(self._monitor_health())
+
+    async def _create_node(self, config: dict[str, Any]) -> TotoroNode:
+        node = TotoroNode(
+            manager=self,
+            pool=type(self.bot.node_pool),
+            bot=self.bot,
+            host=config["host"],
+            port=config["port"],
+            password=config["password"],
+            identifier=config["identifier"],
+            secure=config.get("secure", False),
+            spotify_client_id=self.bot.config.get("spotify_client_id"),
+            spotify_client_secret=self.bot.config.get("spotify_client_secret"),
+        )
+        try:
+            await node.connect()
+        except Exception:
+            if node._session:
+                await node._session.close()
+            raise
+        self.bot.node_pool._nodes[node._identifier] = node
+        return node
+
+    def available_nodes(self) -> dict[str, pomice.Node]:
+        return {
+            ident: node
+            for ident, node in self.nodes.items()
+            if node.is_connected and node._available
+        }
+
+    def select_node(
+        self, region: Optional[str] = None, *, assigned: Optional[Counter] = None
+    ) -> pomice.Node:
+        """Pick the least loaded node, preferring nodes serving the voice region
+
+        `assigned` counts players already headed to each node but not on it yet,
+        so a batch of picks spreads out instead of all landing on the same node.
+        """
+        nodes = self.available_nodes()
+        if not nodes:
+            raise pomice.NoNodesAvailable("There are no nodes available.")
+        candidates = list(nodes.values())
+        if region:
+            local = [n for i, n in nodes.items() if region in self.regions.get(i, ())]
+            candidates = local or candidates
+        if not assigned:
+            return min(candidates, key=node_penalty)
+        return min(candidates, key=lambda n: node_penalty(n) + assigned[n._identifier])
+
+    def node_lost(self, node: TotoroNode) -> None:
+        """Move a dropped node's players elsewhere and start reconnecting it"""
+        if self._closing or not node._available:
+            return
+        node._available = False
+        for player in node.players.values():
+            if hasattr(player, "hold"):
+                player.hold()
+        self.logger.warning(
+            f"Lavalink node {node._identifier} was lost with {node.player_count} players"
+        )
+        self._spawn(self._failover(node))
+
+    async def _failover(self, node: TotoroNode) -> None:
+        await self.migrate_stranded()
+        config = next(c for c in self.node_configs if c["identifier"] == node._identifier)
+        await self._reconnect(config, node)
+
+    def _stranded(self) -> list:
+        """Players whose node is down or no longer knows about them"""
+        available = self.available_nodes()
+        return [
+            player
+            for ident, node in self.nodes.items()
+            for player in node.players.values()
+            if ident not in available
+            or player._player_endpoint_uri != f"sessions/{node._session_id}/players"
+        ]
+
+    async def migrate_stranded(self) -> int:
+        """Move every stranded player to a healthy node, returns how many were moved"""
+        async with self._migrating:
+            return await self._migrate_stranded()
+
+    async def _migrate_stranded(self) -> int:
+        players = [p for p in self._stranded() if hasattr(p, "migrate")]
+        if not players:
+            return 0
+        if not self.available_nodes():
+            self.logger.warning(
+                f"No Lavalink node available, {len(players)} players wait for one to return"
+            )
+            return 0
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        # Picked up front, before any player has moved, so count the picks as load
+        assigned: Counter[str] = Counter()
+        targets = []
+        for player in players:
+            node = self.select_node(
+                player.channel and player.channel.rtc_region, assigned=assigned
+            )
+            assigned[node._identifier] += 1
+            targets.append(node)
+        results = await asyncio.gather(
+            *[player.migrate(node) for player, node in zip(players, targets)],
+            return_exceptions=True,
+        )
+        for player, result in zip(players, results):
+            if isinstance(result, Exception):
+                self.logger.error(
+                    f"Failed to migrate the player of guild {player.guild.id}: {result}"
+                )
+        moved = sum(not isinstance(r, Exception) for r in results)
+        self.logger.info(
+            f"Migrated {moved}/{len(players)} players in {(loop.time() - started) * 1000:.0f}ms"
+        )
+        return moved
+
+    async def _reconnect(
+        self, config: dict[str, Any], node: Optional[TotoroNode] = None
+    ) -> None:
+        """Reconnect a node, or create one that never connected, with exponential backoff"""
+        delay = self.reconnect_delay
+        while not self._closing:
+            await asyncio.sleep(delay)
+            try:
+                if node is None:
+                    node = await self._create_node(config)
+                else:
+                    session = node._session_id
+                    await node.connect(reconnect=True)
+                    # Players can only be placed on it once Lavalink sent the new session ID
+                    node._available = False
+                    node._task = asyncio.create_task(node._listen())
+                    for _ in range(50):
+                        if node._session_id != session:
+                            break
+                        await asyncio.sleep(0.1)
+                    node._available = True
+                break
+            except (pomice.NodeConnectionFailure, OSError) as e:
+                delay = min(delay * 2, self.max_reconnect_delay)
+                self.logger.warning(
+                    f"Lavalink node {config['identifier']} is still down ({e}), retrying in {delay}s"
+                )
+        else:
+            return
+        self.logger.info(f"Lavalink node {config['identifier']} reconnected")
+        await self.migrate_stranded()
+
+    async def _monitor_health(self) -> None:
+        """Ping every node, treating one that doesn't answer in time as lost"""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for node in list(self.available_nodes().values()):
+                try:
+                    pong = await node._websocket.ping()
+                    await asyncio.wait_for(pong, self.health_timeout)
+                except (asyncio.TimeoutError, exceptions.ConnectionClosed):
+                    if isinstance(node, TotoroNode):
+                        self.node_lost(node)
+                        self._spawn(node._websocket.close())
+
+    def close(self) -> None:
+        """Stop monitoring and reconnecting, nodes are disconnected on purpose now"""
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
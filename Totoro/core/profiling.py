@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from types import CodeType, FrameType
+from typing import NamedTuple, Optional
+
+# Frames from files under here are Totoro's own, the rest is discord.py, asyncio etc.
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def frame_name(code: CodeType) -> str:
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_qualname}"
+
+
+def frame_stack(frame: Optional[FrameType]) -> list[CodeType]:
+    """Code objects of a thread's stack, outermost first"""
+    stack = []
+    while frame is not None:
+        stack.append(frame.f_code)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack from a background thread
+
+    Sampling only reads frames every `interval` seconds, so the loop runs at
+    close to full speed while profiled. The result is in the collapsed stack
+    format flamegraph.pl, speedscope and inferno read.
+    """
+
+    def __init__(self, *, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter[tuple[CodeType, ...]] = Counter()
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start sampling the calling thread"""
+        target = threading.get_ident()
+        self.samples.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._sample, args=(target,), name="totoro-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _sample(self, target: int) -> None:
+        started = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                break
+            self.samples[tuple(frame_stack(frame))] += 1
+        self.duration = time.perf_counter() - started
+
+    async def profile(self, seconds: float) -> None:
+        """Sample the running event loop for some seconds"""
+        self.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.stop()
+
+    def collapsed(self) -> str:
+        """One `frame;frame;frame count` line per distinct stack, hottest first"""
+        names: dict[CodeType, str] = {}
+        lines = []
+        for stack, count in self.samples.most_common():
+            path = ";".join(
+                names.get(code) or names.setdefault(code, frame_name(code))
+                for code in stack
+            )
+            lines.append(f"{path} {count}")
+        return "\n".join(lines) + "\n"
+
+    def hottest(self, limit: int = 10) -> list[tuple[str, int]]:
+        """Own code functions seen on the most samples, inclusive of what they call"""
+        counts: Counter[CodeType] = Counter()
+        for stack, count in self.samples.items():
+            counts.update(
+                {code: count for code in stack if code.co_filename.startswith(SOURCE_ROOT)}
+            )
+        return [(frame_name(code), count) for code, count in counts.most_common(limit)]
+
+
+class Stall(NamedTuple):
+    started: float  # time.time() the loop stopped ticking
+    duration: float
+    task: Optional[str]
+    culprit: Optional[str]  # Innermost frame of Totoro's own code
+    stack: list[str]
+
+
+class SlowCallbackDetector:
+    """Reports what was running whenever the event loop blocks for too long
+
+    The loop bumps a heartbeat several times per threshold. A watchdog thread
+    that sees it go stale grabs the loop thread's stack and running task
+    right then, while the blocking code is still on it, and the stall is
+    reported with its full duration once the loop ticks again.
+    """
+
+    def __init__(self, *, threshold: float = 0.1, history: int = 25):
+        self.threshold = threshold
+        self.stalls: deque[Stall] = deque(maxlen=history)
+        self.logger = logging.getLogger(__name__)
+        self._interval = threshold / 4
+        self._last_tick = 0.0
+        self._captured: Optional[tuple[float, Optional[str], list[CodeType]]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start watching the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._stop.clear()
+        self._last_tick = time.monotonic()
+        self._handle = self._loop.call_later(self._interval, self._tick)
+        self._thread = threading.Thread(
+            target=self._watch,
+            args=(threading.get_ident(),),
+            name="totoro-slow-callbacks",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._handle:
+            self._handle.cancel()
+        if self._thread:
+            self._thread.join()
+
+    def _tick(self) -> None:
+        now = time.monotonic()
+        previous, self._last_tick = self._last_tick, now
+        captured = self._captured
+        if captured and captured[0] == previous:
+            self._captured = None
+            self._report(now - previous - self._interval, *captured[1:])
+        self._handle = self._loop.call_later(self._interval, self._tick)
+
+    def _watch(self, target: int) -> None:
+        while not self._stop.wait(self._interval):
+            tick = self._last_tick
+            if time.monotonic() - tick - self._interval < self.threshold:
+                continue
+            if self._captured and self._captured[0] == tick:
+                continue  # Already have this stall's stack
+            frame = sys._current_frames().get(target)
+            task = asyncio.current_task(self._loop)
+            name = task and f"{task.get_name()} ({task.get_coro().__qualname__})"
+            self._captured = (tick, name, frame_stack(frame))
+
+    def _report(self, duration: float, task: Optional[str], stack: list[CodeType]) -> None:
+        own = [code for code in stack if code.co_filename.startswith(SOURCE_ROOT)]
+        stall = Stall(
+            started=time.time() - duration,
+            duration=duration,
+            task=task,
+            culprit=frame_name(own[-1]) if own else None,
+            stack=[frame_name(code) for code in stack],
+        )
+        self.stalls.append(stall)
+        self.logger.warning(
+            f"Event loop blocked for {duration * 1000:.0f}ms in {stall.culprit or task}",
+            extra={
+                "duration_ms": round(duration * 1000, 1),
+                "task": task,
+                "culprit": stall.culprit,
+                "stack": ";".join(stall.stack),
+            },
+        )
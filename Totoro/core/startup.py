@@ -0,0 +1,60 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class StartupTimer:
+    """Times each startup phase and logs a report once all of them are done
+
+    Phases that finish after the gateway is ready, like connecting Lavalink
+    nodes, are announced up front with expect() so the report waits for them.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.phases: dict[str, float] = {}
+        self.extensions: dict[str, float] = {}
+        self.reported = False
+        self._running: dict[str, float] = {}
+        self._expected: set[str] = set()
+
+    def expect(self, name: str) -> None:
+        if name not in self.phases:
+            self._expected.add(name)
+
+    def begin(self, name: str) -> None:
+        self._running[name] = time.perf_counter()
+        self._expected.add(name)
+
+    def end(self, name: str) -> None:
+        started = self._running.pop(name, None)
+        if started is not None:
+            self.record(name, time.perf_counter() - started)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases[name] = seconds
+        self._expected.discard(name)
+        if not self._expected and not self.reported:
+            self.reported = True
+            self.logger.info(self.report())
+
+    def report(self) -> str:
+        lines = ["Startup timings:"]
+        lines += [f"  {name:<16}{seconds * 1000:>9.1f}ms" for name, seconds in self.phases.items()]
+        lines.append(f"  {'total':<16}{sum(self.phases.values()) * 1000:>9.1f}ms")
+        if self.extensions:
+            lines.append("Extensions, loaded concurrently:")
+            lines += [
+                f"  {name:<16}{seconds * 1000:>9.1f}ms"
+                for name, seconds in sorted(self.extensions.items(), key=lambda e: -e[1])
+            ]
+        return "\n".join(lines)
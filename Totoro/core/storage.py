@@ -0,0 +1,206 @@
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS player_snapshots (
+    guild_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    current TEXT,
+    position INTEGER NOT NULL DEFAULT 0,
+    volume INTEGER NOT NULL DEFAULT 100,
+    paused INTEGER NOT NULL DEFAULT 0,
+    loop_mode TEXT,
+    queue TEXT NOT NULL DEFAULT '[]',
+    updated_at REAL NOT NULL,
+    reaped INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS track_index (
+    guild_id INTEGER NOT NULL,
+    uri TEXT NOT NULL,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    score REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (guild_id, uri)
+);
+CREATE TABLE IF NOT EXISTS playlists (
+    user_id INTEGER NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    tracks TEXT NOT NULL,
+    track_count INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, name)
+);
+CREATE TABLE IF NOT EXISTS guild_filters (
+    guild_id INTEGER PRIMARY KEY,
+    presets TEXT NOT NULL
+);
+"""
+
+
+class TotoroStorage:
+    """Local SQLite store for state that should survive restarts
+
+    All queries run on a single dedicated thread so the event loop never
+    blocks on disk and the connection is only ever used from one thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def _run(self, func, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args
+        )
+
+    def _connect(self) -> None:
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(player_snapshots)")}
+        if "reaped" not in columns:  # Databases created before the idle reaper
+            self._conn.execute(
+                "ALTER TABLE player_snapshots ADD COLUMN reaped INTEGER NOT NULL DEFAULT 0"
+            )
+        self._conn.commit()
+
+    async def connect(self) -> None:
+        await self._run(self._connect)
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    def _execute(self, query: str, params: Iterable = ()) -> list[sqlite3.Row]:
+        rows = self._conn.execute(query, tuple(params)).fetchall()
+        self._conn.commit()
+        return rows
+
+    def _executemany(self, query: str, params: Iterable[Iterable]) -> None:
+        with self._conn:
+            self._conn.executemany(query, params)
+
+    async def execute(self, query: str, params: Iterable = ()) -> list[sqlite3.Row]:
+        return await self._run(self._execute, query, params)
+
+    async def executemany(self, query: str, params: Iterable[Iterable]) -> None:
+        await self._run(self._executemany, query, list(params))
+
+    async def save_snapshots(
+        self, snapshots: list[dict[str, Any]], *, reaped: bool = False
+    ) -> None:
+        """Upsert player snapshots in a single transaction
+
+        Snapshots of reaped players aren't restored at startup, only with t!resume.
+        """
+        now = time.time()
+        await self.executemany(
+            "INSERT OR REPLACE INTO player_snapshots "
+            "(guild_id, channel_id, current, position, volume, paused, loop_mode, queue, updated_at, reaped) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    s["guild_id"],
+                    s["channel_id"],
+                    s["current"],
+                    s["position"],
+                    s["volume"],
+                    s["paused"],
+                    s["loop_mode"],
+                    s["queue"],
+                    now,
+                    reaped,
+                )
+                for s in snapshots
+            ],
+        )
+
+    async def load_snapshots(self, *, max_age: float) -> list[dict[str, Any]]:
+        """Load snapshots that are recent enough to be worth restoring"""
+        rows = await self.execute(
+            "SELECT * FROM player_snapshots WHERE updated_at >= ? AND NOT reaped",
+            (time.time() - max_age,),
+        )
+        return [dict(row) for row in rows]
+
+    async def load_snapshot(self, guild_id: int) -> Optional[dict[str, Any]]:
+        rows = await self.execute(
+            "SELECT * FROM player_snapshots WHERE guild_id = ?", (guild_id,)
+        )
+        return dict(rows[0]) if rows else None
+
+    async def delete_snapshot(self, guild_id: int) -> None:
+        await self.execute(
+            "DELETE FROM player_snapshots WHERE guild_id = ?", (guild_id,)
+        )
+
+    def _save_track_index(self, rows: list[tuple], expired: float) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO track_index VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute("DELETE FROM track_index WHERE updated_at < ?", (expired,))
+
+    async def save_track_index(self, rows: list[tuple], *, max_age: float) -> None:
+        """Upsert changed autocomplete index rows and drop ones not played in max_age seconds"""
+        await self._run(self._save_track_index, rows, time.time() - max_age)
+
+    async def load_track_index(self) -> list[tuple]:
+        rows = await self.execute(
+            "SELECT guild_id, uri, title, author, score, updated_at FROM track_index"
+        )
+        return [tuple(row) for row in rows]
+
+    async def save_playlist(self, user_id: int, name: str, tracks: str, track_count: int) -> None:
+        """Store a playlist as a JSON list of queue entry records, replacing any with that name"""
+        await self.execute(
+            "INSERT OR REPLACE INTO playlists (user_id, name, tracks, track_count, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (user_id, name, tracks, track_count, time.time()),
+        )
+
+    async def load_playlist(self, user_id: int, name: str) -> Optional[dict[str, Any]]:
+        rows = await self.execute(
+            "SELECT * FROM playlists WHERE user_id = ? AND name = ?", (user_id, name)
+        )
+        return dict(rows[0]) if rows else None
+
+    async def list_playlists(self, user_id: int) -> list[dict[str, Any]]:
+        rows = await self.execute(
+            "SELECT name, track_count, updated_at FROM playlists WHERE user_id = ? ORDER BY name",
+            (user_id,),
+        )
+        return [dict(row) for row in rows]
+
+    async def delete_playlist(self, user_id: int, name: str) -> bool:
+        rows = await self.execute(
+            "DELETE FROM playlists WHERE user_id = ? AND name = ? RETURNING name",
+            (user_id, name),
+        )
+        return bool(rows)
+
+    async def save_guild_filters(self, guild_id: int, presets: tuple[str, ...]) -> None:
+        """Store the filter presets a guild's players start with, none removes them"""
+        if not presets:
+            await self.execute("DELETE FROM guild_filters WHERE guild_id = ?", (guild_id,))
+            return
+        await self.execute(
+            "INSERT OR REPLACE INTO guild_filters (guild_id, presets) VALUES (?, ?)",
+            (guild_id, ",".join(presets)),
+        )
+
+    async def load_guild_filters(self) -> dict[int, tuple[str, ...]]:
+        rows = await self.execute("SELECT guild_id, presets FROM guild_filters")
+        return {row["guild_id"]: tuple(row["presets"].split(",")) for row in rows}
@@ -1,73 +1,288 @@
+import asyncio
 import logging
 import os
+import time
 import tomllib
-import traceback
 from datetime import datetime
 from typing import Any, Optional
 
-import discord
 import pomice
 from discord.ext import commands
+from utils import TrackCache, TrackIndex
+
+from .cluster import ClusterClient
+from .logs import command_fields, setup_logging
+from .metrics import TotoroMetrics
+from .nodes import TotoroNodeManager
+from .profiles import cache_options, caches_all_members
+from .startup import StartupTimer
+from .storage import TotoroStorage
 
 
 class TotoroConfigHandler:
-    """A simple config helper for Totoro"""
+    """A simple config helper for Totoro, config.toml is only read on first use"""
+
+    _config: Optional[dict[Any, Any]] = None
 
-    with open("./Totoro/core/config.toml", "rb") as confile:
-        config: dict[Any, Any] = tomllib.load(confile)
+    @property
+    def path(self) -> str:
+        return os.environ.get("TOTORO_CONFIG", "./Totoro/core/config.toml")
 
-    def get(self, config_name: str) -> Any:
+    @property
+    def config(self) -> dict[Any, Any]:
+        if TotoroConfigHandler._config is None:
+            with open(self.path, "rb") as confile:
+                TotoroConfigHandler._config = tomllib.load(confile)
+        return TotoroConfigHandler._config
+
+    def get(self, config_name: str, default: Any = None) -> Any:
         """Fetch specified config from config.toml file"""
-        return self.config.get(config_name)  # Returns None if no config found
+        return self.config.get(config_name, default)  # Returns default if no config found
 
 
 class TotoroBot(commands.AutoShardedBot):
     """Totoro bot subclass for added functionality"""
 
-    discord.utils.setup_logging(level=logging.INFO)
-
-    def __init__(self):
+    def __init__(self, cluster: Optional[dict[str, Any]] = None):
+        self.startup_timer = StartupTimer()
+        self.startup_timer.expect("gateway connect")
+        self.config: TotoroConfigHandler = TotoroConfigHandler()
+        with self.startup_timer.phase("config"):
+            self.config.get("token")  # Reads config.toml
+        with self.startup_timer.phase("logging"):
+            setup_logging(self.config)
         super().__init__(
             command_prefix=commands.when_mentioned_or("t!"),
             help_command=commands.MinimalHelpCommand(),
-            intents=discord.Intents.all(),
+            **cache_options(
+                self.config.get("cache_profile", "full"),
+                max_messages=self.config.get("max_messages"),
+                chunk_guilds_at_startup=self.config.get("chunk_guilds_at_startup"),
+                guild_ready_timeout=self.config.get("guild_ready_timeout"),
+                shard_ids=cluster and cluster["shards"],
+                shard_count=cluster and cluster["shard_count"],
+            ),
         )
         self.logger: logging.Logger = logging.getLogger(__name__)
-        self.config: TotoroConfigHandler = TotoroConfigHandler()
+        self.command_logger = logging.getLogger("totoro.commands")
+        # Set when running as one of several cluster processes, see core/cluster.py
+        self.cluster: Optional[ClusterClient] = cluster and ClusterClient(self, cluster)
         self.node_pool = pomice.NodePool()
+        self.node_manager = TotoroNodeManager(self)
         self.owner_ids = set(self.config.get("owner_ids"))
+        self.track_cache = TrackCache(
+            max_tracks=self.config.get("track_cache_max_tracks", 50_000),
+            ttl=self.config.get("track_cache_ttl", 3600),
+        )
+        # Recently played tracks, answers slash command autocomplete
+        self.track_index = TrackIndex(
+            max_tracks=self.config.get("track_index_max_tracks", 5000),
+            guild_tracks=self.config.get("track_index_guild_tracks", 200),
+            half_life=self.config.get("track_index_half_life", 604800),
+        )
+        self.storage = TotoroStorage(
+            self.config.get("database_path", "./Totoro/data/totoro.db")
+        )
+        self.pending_snapshots: list[dict[str, Any]] = []
+        self._snapshot_keys: dict[int, tuple] = {}  # What each guild's last snapshot saved
+        # Filter presets each guild's players start with, see t!filter default
+        self.guild_filters: dict[int, tuple[str, ...]] = {}
+        self.cog_generation = 0  # Bumped whenever a cog is added or removed
+        self.metrics = TotoroMetrics(self)
         self.start_time = datetime.now()
 
     async def startup(self) -> None:
         """Startup method for the bot"""
         self.logger.info(f"Starting Totoro (PID {os.getpid()})")
-        await self._load_extensions()
-        await self.start(self.config.get("token"))
+        if self.cluster:
+            await self.cluster.connect()
+            self.logger.info(
+                f"Running as cluster {self.cluster.id} with shards {self.cluster.shard_ids}"
+            )
+        with self.startup_timer.phase("storage"):
+            await self.storage.connect()
+            # Loaded before connecting so players can be restored as soon as nodes are up
+            self.pending_snapshots = [
+                s
+                for s in await self.storage.load_snapshots(
+                    max_age=self.config.get("snapshot_max_age", 900)
+                )
+                if self.owns_guild(s["guild_id"])
+            ]
+            self.track_index.load(
+                row
+                for row in await self.storage.load_track_index()
+                if row[0] == TrackIndex.GLOBAL or self.owns_guild(row[0])
+            )
+            self.guild_filters = {
+                guild_id: presets
+                for guild_id, presets in (await self.storage.load_guild_filters()).items()
+                if self.owns_guild(guild_id)
+            }
+        await self.metrics.start()
+        self.startup_timer.begin("login")
+        try:
+            await self.start(self.config.get("token"))
+        except asyncio.CancelledError:
+            if not self.is_closed():
+                raise
+
+    async def setup_hook(self) -> None:
+        # Cogs are loaded after login so their background tasks can wait_until_ready
+        self.startup_timer.end("login")
+        with self.startup_timer.phase("extensions"):
+            await self._load_extensions()
+        self.startup_timer.begin("gateway connect")
+
+    @property
+    def members_cached(self) -> bool:
+        """Whether every member is cached, making user counts exact"""
+        state = self._connection
+        return caches_all_members(self.intents, state.member_cache_flags, state._chunk_guilds)
+
+    def user_count(self) -> int:
+        """Amount of users the bot can see, approximated when members aren't cached"""
+        if self.members_cached:
+            return len(self.users)
+        return sum(guild.member_count or 0 for guild in self.guilds)
+
+    async def add_cog(self, cog: commands.Cog, /, **kwargs: Any) -> None:
+        await super().add_cog(cog, **kwargs)
+        self.cog_generation += 1
+
+    async def remove_cog(self, name: str, /, **kwargs: Any) -> Optional[commands.Cog]:
+        cog = await super().remove_cog(name, **kwargs)
+        self.cog_generation += 1
+        return cog
+
+    def owns_guild(self, guild_id: int) -> bool:
+        """Whether a guild belongs to one of this process' shards"""
+        if self.shard_ids is None:
+            return True
+        return (guild_id >> 22) % self.shard_count in self.shard_ids
+
+    def cluster_stats(self) -> dict[str, Any]:
+        """Counts for this process, combined across clusters by gather_stats"""
+        return {
+            "cluster": self.cluster.id if self.cluster else 0,
+            "guilds": len(self.guilds),
+            "users": self.user_count(),
+            "latency": self.latency,
+            "shards": [[shard_id, latency] for shard_id, latency in self.latencies],
+        }
+
+    async def gather_stats(self) -> list[dict[str, Any]]:
+        """cluster_stats of every cluster, just this process' when not clustered"""
+        if self.cluster is None:
+            return [self.cluster_stats()]
+        try:
+            return sorted(await self.cluster.broadcast("stats"), key=lambda s: s["cluster"])
+        except (asyncio.TimeoutError, ConnectionError):
+            self.logger.warning("Cluster supervisor didn't answer, showing local stats only")
+            return [self.cluster_stats()]
+
+    async def snapshot_players(self, *, force: bool = False) -> int:
+        """Persist the state of players that changed since the last save, returns how many
+
+        Idle and paused players whose queue, track and volume are unchanged
+        are skipped. Playing ones are always saved so their position stays
+        current. Pass force to save every player regardless, like on shutdown.
+        """
+        snapshots, keys = [], {}
+        for vc in self.voice_clients:
+            if not hasattr(vc, "snapshot"):
+                continue
+            key = keys[vc.guild.id] = (
+                vc.queue.version,
+                vc.queue.loop_mode,
+                vc.current and vc.current.track_id,
+                vc.is_paused,
+                vc.volume,
+            )
+            playing = vc.current is not None and not vc.is_paused
+            if not force and not playing and self._snapshot_keys.get(vc.guild.id) == key:
+                continue
+            if (snapshot := vc.snapshot()) is not None:
+                snapshots.append(snapshot)
+        if snapshots:
+            await self.storage.save_snapshots(snapshots)
+        self._snapshot_keys = keys  # Guilds without a player anymore are dropped
+        return len(snapshots)
+
+    async def save_track_index(self) -> int:
+        """Persist index entries changed since the last save, returns how many"""
+        rows = self.track_index.changes()
+        if rows:
+            # Entries unplayed for 8 half lives have decayed to nothing
+            await self.storage.save_track_index(
+                rows, max_age=self.track_index.half_life * 8
+            )
+        return len(rows)
+
+    async def _load_extension(self, cog: str) -> None:
+        started = time.perf_counter()
+        try:
+            await self.load_extension(cog)
+            self.logger.info(f"{cog}... success")
+        except commands.ExtensionError as e:
+            self.logger.warning(f"{cog}... failure", exc_info=e, extra={"extension": cog})
+        self.startup_timer.extensions[cog] = time.perf_counter() - started
 
     async def _load_extensions(self) -> None:
+        """Load every cog at once, they don't depend on each other"""
         self.logger.info("Attempting to load cogs:")
-        for ext in os.listdir("Totoro/cogs"):
-            if ext.endswith(".py"):
-                cog = f"cogs.{ext[:-3]}"
-                try:
-                    await self.load_extension(cog)
-                    self.logger.info(f"{cog}... success")
-                except commands.ExtensionError as e:
-                    self.logger.warn(
-                        f"{cog}... failure\n - {''.join(traceback.format_exception(e))}"
-                    )
+        await asyncio.gather(
+            *(
+                self._load_extension(f"cogs.{ext[:-3]}")
+                for ext in sorted(os.listdir("Totoro/cogs"))
+                if ext.endswith(".py")
+            )
+        )
+
+    async def on_command(self, ctx: commands.Context):
+        self.metrics.command_started(ctx)
+
+    async def on_command_completion(self, ctx: commands.Context):
+        latency = self.metrics.command_finished(ctx)
+        self.command_logger.info(
+            "Command finished",
+            extra=command_fields(ctx, latency=latency and round(latency * 1000, 2)),
+        )
 
     async def on_command_error(
         self, ctx: commands.Context, exception: commands.CommandError
     ):
-        self.logger.error(
-            f"Unhandled Exception Caught:\n{''.join(traceback.format_exception(exception))}"
+        latency = self.metrics.command_finished(ctx, failed=True)
+        if isinstance(exception, commands.CommandOnCooldown):
+            return await ctx.send(
+                f"Slow down, try again in {exception.retry_after:.1f}s", delete_after=5
+            )
+        # The traceback is formatted on the logging thread, not here
+        self.command_logger.error(
+            "Unhandled Exception Caught",
+            exc_info=exception,
+            extra=command_fields(ctx, latency=latency and round(latency * 1000, 2)),
         )
 
     async def close(self):
         self.logger.info("Shutting down Totoro now...")
+        try:
+            saved = await self.snapshot_players(force=True)
+            self.logger.info(f"Saved {saved} player snapshots")
+        except Exception as e:
+            self.logger.error(f"Failed to save player snapshots: {e}")
+        try:
+            await self.save_track_index()
+        except Exception as e:
+            self.logger.error(f"Failed to save the track index: {e}")
+        self.node_manager.close()
         await self.node_pool.disconnect()
+        await self.storage.close()
+        await self.metrics.close()
+        if self.cluster:
+            await self.cluster.close()
         await super().close()
 
     async def on_ready(self):
         self.logger.info(f"{self.user} is ready!")
+        self.startup_timer.end("gateway connect")
@@ -1,2 +1,8 @@
+from .actions import *
+from .cache import *
+from .filter_presets import *
 from .helpers import *
 from .paginator import *
+from .player_display import *
+from .track_index import *
+from .track_queue import *
@@ -0,0 +1,92 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Coroutine, Optional
+
+
+class PendingAction:
+    """An action waiting to run, possibly standing in for several requests"""
+
+    __slots__ = ("kind", "value", "merge", "run", "requests", "future")
+
+    def __init__(
+        self,
+        kind: str,
+        value: Any,
+        merge: Optional[Callable[[Any, Any], Any]],
+        run: Callable[[Any], Awaitable[Any]],
+    ):
+        self.kind = kind
+        self.value = value
+        self.merge = merge
+        self.run = run
+        self.requests = 1
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class ActionScheduler:
+    """Runs actions one at a time, merging ones of the same kind that pile up
+
+    An action runs as soon as nothing else is running, after one has run the
+    next waits `window` seconds so that bursts of the same request can be
+    folded into one. Kinds without a merge function are never merged, only
+    serialized with everything else.
+    """
+
+    def __init__(
+        self,
+        *,
+        window: float = 0.25,
+        spawn: Callable[[Coroutine], asyncio.Task] = asyncio.create_task,
+    ):
+        self.window = window
+        self.spawn = spawn
+        self.merged = 0  # Requests folded into an earlier one, for stats
+        self._pending: OrderedDict[Any, PendingAction] = OrderedDict()
+        self._worker: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(
+        self,
+        kind: Any,
+        value: Any,
+        run: Callable[[Any], Awaitable[Any]],
+        *,
+        merge: Optional[Callable[[Any, Any], Any]] = None,
+    ) -> tuple[PendingAction, bool]:
+        """Queue an action, returns it and whether it joined an already pending one
+
+        Only the first requester of a merged action should report its result,
+        the others can return right away.
+        """
+        pending = self._pending.get(kind) if merge else None
+        if pending is not None:
+            pending.value = pending.merge(pending.value, value)
+            pending.requests += 1
+            self.merged += 1
+            return pending, True
+        action = PendingAction(kind, value, merge, run)
+        # Unmergeable actions get a unique key so they queue up behind each other
+        self._pending[kind if merge else object()] = action
+        if self._worker is None or self._worker.done():
+            self._worker = self.spawn(self._drain())
+        return action, False
+
+    async def _drain(self) -> None:
+        try:
+            while self._pending:
+                _, action = self._pending.popitem(last=False)
+                try:
+                    action.future.set_result(await action.run(action.value))
+                except Exception as e:
+                    action.future.set_exception(e)
+                finally:
+                    if not action.future.done():  # Cancelled while running
+                        action.future.cancel()
+                # Requests coming in meanwhile pile up and are merged before running
+                await asyncio.sleep(self.window)
+        finally:
+            for action in self._pending.values():
+                action.future.cancel()
+            self._pending.clear()
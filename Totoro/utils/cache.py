@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query so equivalent lookups share a cache key"""
+    query = query.strip()
+    if query.startswith(("http://", "https://")):
+        return query  # URLs can be case sensitive (e.g YouTube IDs)
+    return " ".join(query.split()).casefold()
+
+
+def track_weight(result: Any) -> int:
+    """Weigh a resolved result by the amount of tracks it holds"""
+    tracks = getattr(result, "tracks", result)
+    try:
+        return max(len(tracks), 1)
+    except TypeError:
+        return 1
+
+
+class TrackCache:
+    """A size bounded LRU cache with TTL expiry for resolved tracks and playlists
+
+    Concurrent lookups for the same key share a single in-flight request.
+    The size of the cache is measured in tracks rather than entries so a
+    single large playlist cannot blow past the memory cap.
+    """
+
+    def __init__(self, *, max_tracks: int, ttl: float):
+        self.max_tracks = max_tracks
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not None
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """Counters describing how the cache has been performing"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "shared": self.shared,
+            "entries": len(self._entries),
+            "tracks": self._weight,
+            "max_tracks": self.max_tracks,
+        }
+
+    def _lookup(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, weight, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            self._weight -= weight
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a cached value or None if missing or expired"""
+        value = self._lookup(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entries if needed"""
+        weight = track_weight(value)
+        if weight > self.max_tracks:
+            return
+        self.pop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, weight, value)
+        self._weight += weight
+        while self._weight > self.max_tracks:
+            _, (_, old_weight, _) = self._entries.popitem(last=False)
+            self._weight -= old_weight
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """Remove a key from the cache and return its value if present"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._weight -= entry[1]
+        return entry[2]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._weight = 0
+
+    async def get_or_fetch(
+        self, key: Hashable, factory: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Return a cached value or resolve it once, no matter how many callers wait on it
+
+        Empty results are returned but not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(self._fetch(key, factory))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so a cancelled caller doesn't cancel the lookup for everyone else
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        value = await factory()
+        if value:
+            self.put(key, value)
+        return value
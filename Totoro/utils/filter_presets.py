@@ -0,0 +1,74 @@
+from functools import lru_cache
+from typing import Iterable
+
+import pomice
+
+# Built once, players get merged copies of these and never modify them
+FILTER_PRESETS: dict[str, tuple[pomice.Filter, ...]] = {
+    "bassboost": (
+        pomice.Equalizer(
+            tag="bassboost", levels=[(0, 0.2), (1, 0.15), (2, 0.1), (3, 0.05), (4, 0.025)]
+        ),
+    ),
+    "nightcore": (pomice.Timescale.nightcore(),),
+    "vaporwave": (
+        pomice.Timescale.vaporwave(),
+        pomice.Equalizer(tag="vaporwave", levels=[(0, 0.1), (1, 0.1), (13, -0.1), (14, -0.1)]),
+    ),
+    "8d": (pomice.Rotation(tag="8d", rotation_hertz=0.2),),
+    # Lavalink has no compressor, evening out the bands is the closest thing
+    "normalize": (
+        pomice.Equalizer(
+            tag="normalize", levels=[(0, -0.1), (1, -0.05), (12, -0.05), (13, -0.1), (14, -0.1)]
+        ),
+    ),
+}
+
+EQ_GAIN_RANGE = (-0.25, 1.0)  # What Lavalink accepts per band
+
+
+def canonical_presets(names: Iterable[str]) -> tuple[str, ...]:
+    """Known preset names without repeats, in FILTER_PRESETS order"""
+    wanted = {name.casefold() for name in names}
+    return tuple(name for name in FILTER_PRESETS if name in wanted)
+
+
+@lru_cache(maxsize=64)
+def merge_presets(names: tuple[str, ...]) -> tuple[pomice.Filter, ...]:
+    """Combine presets into one filter per kind so they go out in a single update
+
+    Equalizer gains add up per band and timescales multiply, any other
+    filter kind is taken from the last preset that has one.
+    """
+    tag = "+".join(names)
+    bands: dict[int, float] = {}
+    speed = pitch = rate = 1.0
+    others: dict[type, pomice.Filter] = {}
+    for name in names:
+        for preset in FILTER_PRESETS[name]:
+            if isinstance(preset, pomice.Equalizer):
+                for band, gain in preset.raw:
+                    bands[band] = bands.get(band, 0.0) + gain
+            elif isinstance(preset, pomice.Timescale):
+                speed, pitch, rate = (
+                    speed * preset.speed,
+                    pitch * preset.pitch,
+                    rate * preset.rate,
+                )
+            else:
+                others[type(preset)] = preset
+    merged: list[pomice.Filter] = []
+    if bands:
+        low, high = EQ_GAIN_RANGE
+        merged.append(
+            pomice.Equalizer(
+                tag=f"{tag}:eq",
+                levels=[
+                    (band, round(min(high, max(low, gain)), 4)) for band, gain in bands.items()
+                ],
+            )
+        )
+    if (speed, pitch, rate) != (1.0, 1.0, 1.0):
+        merged.append(pomice.Timescale(tag=f"{tag}:timescale", speed=speed, pitch=pitch, rate=rate))
+    merged.extend(others.values())
+    return tuple(merged)
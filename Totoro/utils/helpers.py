@@ -11,6 +11,15 @@ def humanize_timedelta(td: timedelta, *, precise: bool = False) -> str:
     return humanize.naturaldelta(td)
 
 
+def format_duration(ms: float) -> str:
+    """Format milliseconds like a media player would, m:ss or h:mm:ss"""
+    minutes, seconds = divmod(int(ms // 1000), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02}:{seconds:02}"
+    return f"{minutes}:{seconds:02}"
+
+
 def chunk_iter(iterable: Iterable, chunk_size: int) -> list[list[Any]]:
     """Chunk a list into smaller list by specified chunk size"""
     for i in range(0, len(iterable), chunk_size):
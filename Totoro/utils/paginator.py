@@ -1,47 +1,115 @@
-from asyncio import TimeoutError
-from typing import Union
+import asyncio
+import inspect
+from typing import Awaitable, Callable, Optional, Union
 
 import discord
 from discord.ext import commands
 
+PageFactory = Callable[[int], Union[discord.Embed, Awaitable[discord.Embed]]]
+
+
+class Paginator(discord.ui.View):
+    """Button based paginator that renders pages on demand
+
+    Pages are built by a factory whenever they are shown, caching them is up to
+    the factory. The page count can be a callable so pages of something that
+    changes, like a queue, are counted again on every flip. A flip is shown
+    right away, rapid flips after it are coalesced into a single message edit.
+    """
 
-class Paginator:
     def __init__(
         self,
-        embeds: list[discord.Embed],
+        page_factory: PageFactory,
+        page_count: Union[int, Callable[[], int]],
+        *,
+        timeout: float = 60,
+        debounce: float = 0.35,
     ):
-        self.embeds = embeds
+        super().__init__(timeout=timeout)
+        self.page_factory = page_factory
+        self._page_count = page_count
+        self.debounce = debounce
+        self.message: Optional[discord.Message] = None
+        self._author_id: Optional[int] = None
         self._index = 0
-        self._reactions = ["⬅️", "🗑️", "➡️"]
+        self._shown = 0
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_embeds(cls, embeds: list[discord.Embed], **kwargs) -> "Paginator":
+        return cls(embeds.__getitem__, len(embeds), **kwargs)
+
+    @property
+    def page_count(self) -> int:
+        count = self._page_count() if callable(self._page_count) else self._page_count
+        return max(1, count)
+
+    async def render(self, index: int) -> discord.Embed:
+        embed = self.page_factory(index)
+        if inspect.isawaitable(embed):
+            embed = await embed
+        return embed
 
     async def start(self, ctx: commands.Context) -> None:
-        msg = await ctx.send(embed=self.embeds[self._index])
-        for reaction in self._reactions:
-            await msg.add_reaction(reaction)
+        self._author_id = ctx.author.id
+        self._update_buttons()
+        self.message = await ctx.send(embed=await self.render(self._index), view=self)
 
-        def check(reaction: discord.Reaction, user: discord.User):
-            return reaction in self._reactions and user.id == ctx.author.id
+    async def interaction_check(self, inter: discord.Interaction) -> bool:
+        if inter.user.id != self._author_id:
+            await inter.response.send_message(
+                "You are not able to use this menu", ephemeral=True, delete_after=5
+            )
+            return False
+        return True
 
-        while True:
+    async def on_timeout(self) -> None:
+        if self._flush_task:
+            self._flush_task.cancel()
+        if self.message:
             try:
-                r, u = await ctx.bot.wait_for("reaction_add", check=check, timeout=20)
-            except TimeoutError:
-                await msg.clear_reactions()
-                break
-            if r.emoji == "⬅️":
-                self.page_left()
-                await msg.edit(embed=self.embeds[self._index])
-            if r.emoji == "🗑️":
-                await msg.clear_reactions()
-                break
-            if r.emoji == "➡️":
-                self.page_right()
-                await msg.edit(embed=self.embeds[self._index])
-
-    def page_right(self):
-        if self._index != len(self.embeds):
-            self._index += 1
-
-    def page_left(self):
-        if self._index != 0:
-            self._index -= 1
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+    def _update_buttons(self, page_count: Optional[int] = None) -> None:
+        self.page_left.disabled = self._index == 0
+        self.page_right.disabled = self._index >= (page_count or self.page_count) - 1
+
+    def _flip(self, index: int) -> None:
+        self._index = max(0, min(index, self.page_count - 1))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self) -> None:
+        """Edit the message now, flips arriving within the debounce are shown together after it"""
+        while self._shown != self._index:
+            # Pages may have gone away while waiting out the debounce
+            page_count = self.page_count
+            index = self._index = min(self._index, page_count - 1)
+            self._update_buttons(page_count)
+            try:
+                await self.message.edit(embed=await self.render(index), view=self)
+            except discord.HTTPException:
+                self.stop()  # Deleted or no longer editable, nothing left to page through
+                return
+            self._shown = index
+            await asyncio.sleep(self.debounce)
+
+    @discord.ui.button(emoji="⬅️", style=discord.ButtonStyle.secondary)
+    async def page_left(self, inter: discord.Interaction, _):
+        await inter.response.defer()
+        self._flip(self._index - 1)
+
+    @discord.ui.button(emoji="🗑️", style=discord.ButtonStyle.danger)
+    async def close(self, inter: discord.Interaction, _):
+        await inter.response.defer()
+        self.stop()
+        if self._flush_task:
+            self._flush_task.cancel()
+        await self.message.edit(view=None)
+
+    @discord.ui.button(emoji="➡️", style=discord.ButtonStyle.secondary)
+    async def page_right(self, inter: discord.Interaction, _):
+        await inter.response.defer()
+        self._flip(self._index + 1)
@@ -0,0 +1,172 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Callable, Optional
+
+import discord
+
+from .helpers import format_duration, humanize_timedelta
+from .track_queue import QueueEntry
+
+if TYPE_CHECKING:
+    import pomice
+
+
+class PlayerDisplay:
+    """Formatted now playing and queue embeds of a player, cached until they change
+
+    Track lines are formatted once per entry and reused across queue changes,
+    pages are kept until the queue changes at or before them and the now
+    playing embed is rebuilt only when the track, pause state, volume,
+    filters, loop mode or queue changed.
+    Time left is shown as a Discord timestamp, which clients count down on
+    their own, so it never needs an edit.
+    """
+
+    ENDS_TOLERANCE = 3  # Seconds the end of a track may drift before it's rebuilt
+
+    def __init__(
+        self,
+        player: "pomice.Player",
+        *,
+        page_size: int = 10,
+        line_cache_size: int = 500,
+        refresh_interval: float = 10,
+    ):
+        self.player = player
+        self.page_size = page_size
+        self.line_cache_size = line_cache_size
+        self.refresh_interval = refresh_interval
+        self.live_message: Optional[discord.Message] = None
+        self._lines: OrderedDict[QueueEntry, str] = OrderedDict()
+        self._pages: dict[int, discord.Embed] = {}
+        self._pages_version = -1
+        self._now_playing: Optional[discord.Embed] = None
+        self._now_playing_key: Optional[tuple] = None
+        self._ends_at: Optional[float] = None
+        self._live_task: Optional[asyncio.Task] = None
+
+    def line(self, entry: QueueEntry) -> str:
+        """A queued track as shown in the queue, cached per entry"""
+        line = self._lines.get(entry)
+        if line is not None:
+            self._lines.move_to_end(entry)
+            return line
+        length = "LIVE" if entry.is_stream else format_duration(entry.length)
+        line = self._lines[entry] = f"{entry.author} - {entry.title} `{length}`"
+        if len(self._lines) > self.line_cache_size:
+            self._lines.popitem(last=False)
+        return line
+
+    def page_count(self) -> int:
+        return self.player.queue.page_count(self.page_size)
+
+    def queue_page(self, index: int) -> discord.Embed:
+        """One page of the queue, index starting at 0"""
+        queue = self.player.queue
+        changed = queue.changed_since(self._pages_version)
+        if changed is not None:
+            first = changed // self.page_size
+            self._pages = {i: page for i, page in self._pages.items() if i < first}
+            for page in self._pages.values():  # Counts in the footer changed either way
+                page.set_footer(text=self._footer())
+            self._pages_version = queue.version
+        page = self._pages.get(index)
+        if page is None:
+            start = index * self.page_size + 1
+            page = self._pages[index] = discord.Embed(
+                title=f"Page: {index + 1}",
+                description="\n".join(
+                    f"`{pos}.` {self.line(entry)}"
+                    for pos, entry in enumerate(queue.page(index, self.page_size), start)
+                ),
+            ).set_footer(text=self._footer())
+        return page
+
+    def _footer(self) -> str:
+        queue = self.player.queue
+        return f"{len(queue)} tracks | {format_duration(queue.length)}"
+
+    def now_playing(self) -> Optional[discord.Embed]:
+        """The now playing embed, None when nothing is playing"""
+        player = self.player
+        np = player.current
+        if np is None:
+            return None
+        queue = player.queue
+        key = (
+            np.track_id,
+            player.is_paused,
+            player.volume,
+            player.filter_presets,
+            queue.version,
+            queue.loop_mode,
+        )
+        ends_at = None
+        if not player.is_paused and not np.is_stream:
+            ends_at = time.time() + (np.length - player.position) / 1000
+        if (
+            key == self._now_playing_key
+            and (ends_at is None) == (self._ends_at is None)
+            and (ends_at is None or abs(ends_at - self._ends_at) < self.ENDS_TOLERANCE)
+        ):
+            return self._now_playing
+
+        if np.is_stream:
+            ends = "Live stream"
+        elif ends_at is None:
+            ends = f"Paused at {format_duration(player.position)}"
+        else:
+            ends = discord.utils.format_dt(datetime.fromtimestamp(ends_at), "R")
+        embed = (
+            discord.Embed(
+                title=np.title,
+                description=f"from: {np.author}",
+                color=discord.Color.green(),
+                url=np.uri,
+            )
+            .set_thumbnail(url=np.thumbnail)
+            .set_footer(text=f"ID: {np.identifier}")
+            .add_field(name="Requester", value=np.requester)
+            .add_field(name="Length", value=humanize_timedelta(timedelta(milliseconds=np.length)))
+            .add_field(name="Ends", value=ends)
+            .add_field(name="Filters", value=", ".join(player.filter_presets or ()) or "None")
+            .add_field(name="Seekable", value=np.is_seekable)
+            .add_field(name="Volume", value=f"{player.volume}%")
+        )
+        if queue:
+            embed.add_field(
+                name=f"Up Next ({len(queue)} queued)",
+                value=self.line(queue.peek()[0]),
+                inline=False,
+            )
+        self._now_playing, self._now_playing_key, self._ends_at = embed, key, ends_at
+        return embed
+
+    def show_live(
+        self, message: discord.Message, spawn: Callable[..., asyncio.Task]
+    ) -> None:
+        """Keep a message showing the now playing embed, replacing the previous one"""
+        self.live_message = message
+        if self._live_task is None or self._live_task.done():
+            self._live_task = spawn(self._refresh_live())
+
+    async def _refresh_live(self) -> None:
+        # Changes are picked up once per interval, however many happened in between
+        shown = self.now_playing()
+        while self.live_message is not None:
+            await asyncio.sleep(self.refresh_interval)
+            message = self.live_message
+            embed = self.now_playing()
+            if embed is None or embed is shown:
+                continue
+            try:
+                await message.edit(embed=embed)
+            except discord.NotFound:
+                if message is self.live_message:  # Unless it was replaced meanwhile
+                    self.live_message = None
+                continue
+            except discord.HTTPException:
+                continue
+            shown = embed
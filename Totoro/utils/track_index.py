@@ -0,0 +1,166 @@
+import heapq
+import math
+import time
+from collections import Counter
+from typing import Iterable, NamedTuple, Optional
+
+
+def trigrams(text: str) -> set[str]:
+    """Padded trigrams of each word, the leading ones double as prefix matches"""
+    grams = set()
+    for word in text.casefold().split():
+        word = f"  {word} "
+        grams.update(word[i : i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+class IndexedTrack(NamedTuple):
+    uri: str
+    title: str
+    author: str
+
+
+class TrackIndex:
+    """Bounded in-memory trigram index of tracks played globally and per guild
+
+    Every play adds to a track's score, which halves every `half_life`
+    seconds. Once over capacity the lowest scoring tracks are dropped, the
+    global index bounds what guilds can reference.
+    """
+
+    GLOBAL = 0  # Guild ID the global scores are kept under
+
+    def __init__(
+        self, *, max_tracks: int = 5000, guild_tracks: int = 200, half_life: float = 604800
+    ):
+        self.max_tracks = max_tracks
+        self.guild_tracks = guild_tracks
+        self.half_life = half_life
+        self.tracks: dict[str, IndexedTrack] = {}
+        # Guild ID -> uri -> (score, when it was last updated)
+        self.scores: dict[int, dict[str, tuple[float, float]]] = {self.GLOBAL: {}}
+        self._postings: dict[str, set[str]] = {}
+        self._changed: set[tuple[int, str]] = set()
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def _decayed(self, entry: tuple[float, float], now: float) -> float:
+        score, updated = entry
+        return score * 0.5 ** ((now - updated) / self.half_life)
+
+    def add(
+        self,
+        uri: str,
+        title: str,
+        author: str,
+        *,
+        guild_id: Optional[int] = None,
+        weight: float = 1.0,
+        now: Optional[float] = None,
+    ) -> None:
+        """Count a play of a track, in a guild and globally"""
+        if not uri:
+            return
+        now = time.time() if now is None else now
+        if uri not in self.tracks:
+            self._insert(IndexedTrack(uri, title, author))
+        for gid in (self.GLOBAL, guild_id) if guild_id else (self.GLOBAL,):
+            scores = self.scores.setdefault(gid, {})
+            entry = scores.get(uri)
+            scores[uri] = (weight + (self._decayed(entry, now) if entry else 0.0), now)
+            self._changed.add((gid, uri))
+        if len(self.tracks) > self.max_tracks:
+            self._evict(self.GLOBAL, self.max_tracks, now)
+        if guild_id and len(self.scores[guild_id]) > self.guild_tracks:
+            self._evict(guild_id, self.guild_tracks, now)
+
+    def _insert(self, track: IndexedTrack) -> None:
+        self.tracks[track.uri] = track
+        for gram in trigrams(f"{track.title} {track.author}"):
+            self._postings.setdefault(gram, set()).add(track.uri)
+
+    def _evict(self, guild_id: int, limit: int, now: float) -> None:
+        # Trim to 90% of the limit so evictions happen in batches
+        scores = self.scores[guild_id]
+        if guild_id != self.GLOBAL:
+            for uri in [uri for uri in scores if uri not in self.tracks]:
+                del scores[uri]
+        keep = int(limit * 0.9)
+        doomed = heapq.nsmallest(
+            len(scores) - keep, scores, key=lambda uri: self._decayed(scores[uri], now)
+        )
+        for uri in doomed:
+            del scores[uri]
+            if guild_id == self.GLOBAL:
+                self._forget(uri)
+
+    def _forget(self, uri: str) -> None:
+        track = self.tracks.pop(uri)
+        for gram in trigrams(f"{track.title} {track.author}"):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(uri)
+                if not posting:
+                    del self._postings[gram]
+        # Guilds still referencing it are skipped on lookup and trimmed by their own bound
+
+    def popularity(self, uri: str, guild_id: Optional[int], now: float) -> float:
+        """Global plays plus a boost for plays in the guild itself"""
+        score = self._decayed(self.scores[self.GLOBAL][uri], now)
+        local = self.scores.get(guild_id, {}).get(uri) if guild_id else None
+        if local:
+            score += 4 * self._decayed(local, now)
+        return score
+
+    def search(
+        self, query: str, *, guild_id: Optional[int] = None, limit: int = 25
+    ) -> list[IndexedTrack]:
+        """Best matching tracks, most popular first when the query is empty"""
+        now = time.time()
+        grams = trigrams(query)
+        if not grams:
+            candidates = [
+                uri for uri in self.scores.get(guild_id, ()) if uri in self.tracks
+            ] or self.scores[self.GLOBAL]
+            best = heapq.nlargest(
+                limit, candidates, key=lambda uri: self.popularity(uri, guild_id, now)
+            )
+            return [self.tracks[uri] for uri in best]
+        matches: Counter[str] = Counter()
+        for gram in grams:
+            matches.update(self._postings.get(gram, ()))
+        # Most of the query has to match, popularity breaks ties between similar matches
+        threshold = max(1, math.ceil(len(grams) * 0.6))
+        best = heapq.nlargest(
+            limit,
+            (uri for uri, count in matches.items() if count >= threshold),
+            key=lambda uri: (
+                matches[uri] / len(grams),
+                self.popularity(uri, guild_id, now),
+            ),
+        )
+        return [self.tracks[uri] for uri in best]
+
+    def changes(self) -> list[tuple]:
+        """Rows of (guild_id, uri, title, author, score, updated_at) changed since the last call"""
+        rows = [
+            (gid, uri, self.tracks[uri].title, self.tracks[uri].author, *self.scores[gid][uri])
+            for gid, uri in self._changed
+            if uri in self.tracks and uri in self.scores.get(gid, ())
+        ]
+        self._changed.clear()
+        return rows
+
+    def load(self, rows: Iterable[tuple]) -> None:
+        """Restore persisted rows, keeping the highest scoring ones within bounds"""
+        now = time.time()
+        rows = sorted(rows, key=lambda r: (r[0] != self.GLOBAL, -self._decayed(r[4:], now)))
+        for gid, uri, title, author, score, updated in rows:
+            if gid == self.GLOBAL:
+                if len(self.tracks) >= self.max_tracks:
+                    continue
+                self._insert(IndexedTrack(uri, title, author))
+            elif uri not in self.tracks or len(self.scores.get(gid, ())) >= self.guild_tracks:
+                continue
+            self.scores.setdefault(gid, {})[uri] = (score, updated)
@@ -0,0 +1,386 @@
+import random
+from collections import deque
+from typing import Iterable, Iterator, Optional, Union
+
+import discord
+import pomice
+
+
+class QueueEntry:
+    """Compact record of a queued track
+
+    Keeps only what is needed to display the track and to rebuild a
+    pomice.Track when it is about to be played. Unlike pomice.Track it holds
+    no command context, raw info dict or playlist back-reference.
+    """
+
+    __slots__ = (
+        "track_id",
+        "title",
+        "author",
+        "length",
+        "uri",
+        "identifier",
+        "isrc",
+        "thumbnail",
+        "is_stream",
+        "track_type",
+        "search_type",
+        "requester",
+    )
+
+    def __init__(
+        self,
+        *,
+        track_id: str,
+        title: str,
+        author: str,
+        length: int,
+        uri: str,
+        identifier: str,
+        isrc: Optional[str],
+        thumbnail: Optional[str],
+        is_stream: bool,
+        track_type: pomice.TrackType,
+        search_type: Optional[pomice.SearchType],
+        requester: Optional[Union[discord.Member, discord.User]],
+    ):
+        self.track_id = track_id
+        self.title = title
+        self.author = author
+        self.length = length
+        self.uri = uri
+        self.identifier = identifier
+        self.isrc = isrc
+        self.thumbnail = thumbnail
+        self.is_stream = is_stream
+        self.track_type = track_type
+        self.search_type = search_type  # None once the track is playable as is
+        self.requester = requester
+
+    def __repr__(self) -> str:
+        return f"<QueueEntry title={self.title!r} author={self.author!r}>"
+
+    @classmethod
+    def from_track(cls, track: pomice.Track) -> "QueueEntry":
+        return cls(
+            track_id=track.track_id,
+            title=track.title,
+            author=track.author,
+            length=track.length,
+            uri=track.uri,
+            identifier=track.identifier,
+            isrc=track.isrc,
+            thumbnail=track.thumbnail,
+            is_stream=track.is_stream,
+            track_type=track.track_type,
+            search_type=None if track.original is not None else track._search_type,
+            requester=track.requester,
+        )
+
+    def to_record(self) -> list:
+        """Serialize into a JSON friendly list, the requester is kept as an ID"""
+        return [
+            self.track_id,
+            self.title,
+            self.author,
+            self.length,
+            self.uri,
+            self.identifier,
+            self.isrc,
+            self.thumbnail,
+            self.is_stream,
+            self.track_type.value,
+            self.search_type.value if self.search_type else None,
+            self.requester.id if self.requester else None,
+        ]
+
+    @classmethod
+    def from_record(
+        cls,
+        record: list,
+        requester: Optional[Union[discord.Member, discord.User]] = None,
+    ) -> "QueueEntry":
+        """Rebuild an entry from to_record() output without asking Lavalink"""
+        (
+            track_id,
+            title,
+            author,
+            length,
+            uri,
+            identifier,
+            isrc,
+            thumbnail,
+            is_stream,
+            track_type,
+            search_type,
+            _,
+        ) = record
+        return cls(
+            track_id=track_id,
+            title=title,
+            author=author,
+            length=length,
+            uri=uri,
+            identifier=identifier,
+            isrc=isrc,
+            thumbnail=thumbnail,
+            is_stream=is_stream,
+            track_type=pomice.TrackType(track_type),
+            search_type=pomice.SearchType(search_type) if search_type else None,
+            requester=requester,
+        )
+
+    @property
+    def playable(self) -> bool:
+        """Whether Lavalink can play this entry without searching for it first"""
+        return self.search_type is None
+
+    @property
+    def key(self) -> str:
+        """Identity used to detect duplicate entries"""
+        return self.uri or self.identifier or self.track_id
+
+    def to_track(self) -> pomice.Track:
+        track = pomice.Track(
+            track_id=self.track_id,
+            info={
+                "title": self.title,
+                "author": self.author,
+                "length": self.length,
+                "uri": self.uri,
+                "identifier": self.identifier,
+                "isrc": self.isrc,
+                "thumbnail": self.thumbnail,
+                "isStream": self.is_stream,
+                "isSeekable": not self.is_stream,
+            },
+            track_type=self.track_type,
+            search_type=self.search_type or pomice.SearchType.ytsearch,
+            requester=self.requester,
+        )
+        if self.playable:
+            track.original = track
+        return track
+
+
+class TrackQueue:
+    """List backed queue of QueueEntry records
+
+    Consumed entries are skipped over with a head index and only compacted
+    away in bulk, so getting the next track and slicing out a page are both
+    cheap regardless of how long the queue is. The total length is kept up
+    to date as entries come and go, and recent changes remember the first
+    position they touched so views can keep what's in front of it.
+    """
+
+    COMPACT_THRESHOLD = 1024
+    CHANGE_LOG_SIZE = 64
+
+    def __init__(self, *, max_size: Optional[int] = None, history_size: int = 50):
+        self.max_size = max_size
+        self.loop_mode: Optional[pomice.LoopMode] = None
+        self.current: Optional[QueueEntry] = None
+        self.history: deque[QueueEntry] = deque(maxlen=history_size)
+        self.version = 0  # Bumped on every change to the upcoming entries
+        self.length = 0  # Milliseconds of upcoming tracks, streams not counted
+        self._entries: list[Optional[QueueEntry]] = []
+        self._head = 0
+        self._changes: deque[tuple[int, int]] = deque(maxlen=self.CHANGE_LOG_SIZE)
+
+    def __len__(self) -> int:
+        return len(self._entries) - self._head
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[QueueEntry]:
+        for i in range(self._head, len(self._entries)):
+            yield self._entries[i]
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            # Only the sliced entries are copied, not everything after the head first
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self._entries[self._head + start : self._head + max(start, stop)]
+            return [self._entries[self._head + i] for i in range(start, stop, step)]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("queue index out of range")
+        return self._entries[self._head + index]
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self) == 0
+
+    @property
+    def is_full(self) -> bool:
+        return self.max_size is not None and len(self) >= self.max_size
+
+    def _changed(self, position: int = 0) -> None:
+        self.version += 1
+        self._changes.append((self.version, position))
+
+    @staticmethod
+    def _length_of(entry: QueueEntry) -> int:
+        return 0 if entry.is_stream else entry.length
+
+    def changed_since(self, version: int) -> Optional[int]:
+        """First position changed after a version, None if nothing changed since
+
+        Positions are counted from the head at the time of each change, a get()
+        shifts every entry and so counts as a change at 0.
+        """
+        if version >= self.version:
+            return None
+        position = None
+        for changed, at in reversed(self._changes):
+            if changed <= version:
+                return position
+            position = at if position is None else min(position, at)
+        return 0  # Older than the log remembers, assume everything changed
+
+    def _compact(self) -> None:
+        if self._head:
+            del self._entries[: self._head]
+            self._head = 0
+
+    def put(self, track: Union[pomice.Track, QueueEntry]) -> QueueEntry:
+        """Add a track to the end of the queue"""
+        if self.is_full:
+            raise pomice.QueueFull(
+                f"Queue max size of {self.max_size} has been reached."
+            )
+        entry = track if isinstance(track, QueueEntry) else QueueEntry.from_track(track)
+        self._entries.append(entry)
+        self.length += self._length_of(entry)
+        self._changed(len(self) - 1)
+        return entry
+
+    def put_many(self, tracks: Iterable[Union[pomice.Track, QueueEntry]]) -> int:
+        """Add as many tracks as fit in the queue, returns how many were added"""
+        added, start = 0, len(self)
+        for track in tracks:
+            if self.is_full:
+                break
+            entry = track if isinstance(track, QueueEntry) else QueueEntry.from_track(track)
+            self._entries.append(entry)
+            self.length += self._length_of(entry)
+            added += 1
+        if added:
+            self._changed(start)
+        return added
+
+    def get(self, *, repeat: bool = True) -> pomice.Track:
+        """Pop the next track to play, honoring the loop mode
+
+        Pass repeat=False to move past the current track even when looping it,
+        i.e when it was skipped.
+        """
+        if self.current is not None:
+            if repeat and self.loop_mode is pomice.LoopMode.TRACK:
+                return self.current.to_track()
+            if self.loop_mode is pomice.LoopMode.QUEUE:
+                # Not checked against max_size on purpose, the entry popped below makes
+                # room for it again, so a full queue stays at max_size instead of
+                # silently dropping a track from the loop
+                self._entries.append(self.current)
+                self.length += self._length_of(self.current)
+            self.history.append(self.current)
+        if self.is_empty:
+            self.current = None
+            raise pomice.QueueEmpty("No items in the queue.")
+        entry = self._entries[self._head]
+        self._entries[self._head] = None
+        self._head += 1
+        self.length -= self._length_of(entry)
+        if self._head >= self.COMPACT_THRESHOLD and self._head * 2 >= len(self._entries):
+            self._compact()
+        self.current = entry
+        self._changed()
+        return entry.to_track()
+
+    def peek(self, amount: int = 1) -> list[QueueEntry]:
+        return self._entries[self._head : self._head + amount]
+
+    def page(self, index: int, size: int) -> list[QueueEntry]:
+        """Slice out a single page of entries, index starting at 0"""
+        start = self._head + index * size
+        return self._entries[start : start + size]
+
+    def page_count(self, size: int) -> int:
+        return -(-len(self) // size)
+
+    def remove(self, index: int) -> QueueEntry:
+        """Remove the entry at the index, index starting at 0"""
+        if index < 0:  # Unlike indexing, never counted from the end
+            raise IndexError("queue index out of range")
+        entry = self[index]
+        del self._entries[self._head + index]
+        self.length -= self._length_of(entry)
+        self._changed(index)
+        return entry
+
+    def move(self, index: int, to: int) -> QueueEntry:
+        """Move the entry at an index to another position"""
+        if to < 0:
+            raise IndexError("queue index out of range")
+        entry = self.remove(index)
+        to = min(to, len(self))
+        self._entries.insert(self._head + to, entry)
+        self.length += self._length_of(entry)
+        self._changed(to)
+        return entry
+
+    def replace(self, old: QueueEntry, new: QueueEntry, *, within: int = 50) -> bool:
+        """Swap an entry near the front of the queue for another one"""
+        for i in range(self._head, min(self._head + within, len(self._entries))):
+            if self._entries[i] is old:
+                self._entries[i] = new
+                self.length += self._length_of(new) - self._length_of(old)
+                self._changed(i - self._head)
+                return True
+        return False
+
+    def discard(self, entry: QueueEntry, *, within: int = 50) -> bool:
+        """Remove an entry near the front of the queue if it's still there"""
+        for i in range(self._head, min(self._head + within, len(self._entries))):
+            if self._entries[i] is entry:
+                del self._entries[i]
+                self.length -= self._length_of(entry)
+                self._changed(i - self._head)
+                return True
+        return False
+
+    def shuffle(self) -> None:
+        self._compact()
+        random.shuffle(self._entries)
+        self._changed()
+
+    def dedupe(self) -> int:
+        """Remove repeated tracks keeping the first occurrence, returns amount removed"""
+        seen = set()
+        if self.current is not None:
+            seen.add(self.current.key)
+        kept = []
+        for entry in self:
+            if entry.key not in seen:
+                seen.add(entry.key)
+                kept.append(entry)
+        removed = len(self) - len(kept)
+        self._entries = kept
+        self._head = 0
+        self.length = sum(map(self._length_of, kept))
+        self._changed()
+        return removed
+
+    def clear(self) -> None:
+        self._entries = []
+        self._head = 0
+        self.length = 0
+        self._changed()
+
+    def set_loop_mode(self, mode: Optional[pomice.LoopMode]) -> None:
+        self.loop_mode = mode
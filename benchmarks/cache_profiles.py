@@ -0,0 +1,133 @@
+"""Compare the memory held by each gateway cache profile
+
+Feeds synthetic GUILD_CREATE and MESSAGE_CREATE payloads straight into
+discord.py's connection state, no Discord connection needed.
+
+    python benchmarks/cache_profiles.py [guilds] [members per guild]
+"""
+
+import asyncio
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Totoro"))
+
+import discord
+from core.profiles import CACHE_PROFILES, cache_options, caches_all_members
+
+SELF_ID = 1
+VOICE_MEMBERS = 5
+MESSAGES = 200
+
+
+def user(uid: int) -> dict:
+    return {"id": str(uid), "username": f"user{uid}", "discriminator": "0", "avatar": None}
+
+
+def guild_payload(gid: int, members: int, chunked: bool) -> dict:
+    """Without chunking Discord only sends large guilds' voice members and ourselves"""
+    first = gid * 1_000_000
+    member_ids = [SELF_ID] + list(range(first, first + members))
+    sent_ids = member_ids if chunked else member_ids[: VOICE_MEMBERS + 1]
+    return {
+        "id": str(gid),
+        "name": f"guild {gid}",
+        "owner_id": str(first),
+        "member_count": len(member_ids),
+        "roles": [{"id": str(gid), "name": "@everyone", "permissions": "0", "position": 0}],
+        "channels": [
+            {"id": str(gid + 1), "type": 0, "name": "general", "position": 0},
+            {"id": str(gid + 2), "type": 2, "name": "music", "position": 1,
+             "bitrate": 64000, "user_limit": 0},
+        ],
+        "members": [
+            {"user": user(uid), "roles": [], "joined_at": "2022-01-01T00:00:00+00:00", "flags": 0}
+            for uid in sent_ids
+        ],
+        "presences": [
+            {"user": {"id": str(uid)}, "status": "online", "activities": [],
+             "client_status": {"desktop": "online"}}
+            for uid in sent_ids[1:]
+        ],
+        "voice_states": [
+            {"user_id": str(uid), "channel_id": str(gid + 2), "session_id": "x",
+             "deaf": False, "mute": False, "self_deaf": False, "self_mute": False,
+             "suppress": False}
+            for uid in member_ids[1 : VOICE_MEMBERS + 1]
+        ],
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "threads": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+        "large": True,
+    }
+
+
+def message_payload(gid: int, mid: int, members: int) -> dict:
+    author = gid * 1_000_000 + mid % members
+    return {
+        "id": str(mid),
+        "channel_id": str(gid + 1),
+        "guild_id": str(gid),
+        "author": user(author),
+        "member": {"roles": [], "joined_at": "2022-01-01T00:00:00+00:00", "flags": 0},
+        "content": "t!play never gonna give you up",
+        "timestamp": "2022-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+
+async def measure(profile: str, guilds: int, members: int) -> tuple[int, int, int, bool]:
+    options = cache_options(profile)
+    chunked = options.pop("chunk_guilds_at_startup")
+    exact = caches_all_members(options["intents"], options["member_cache_flags"], chunked)
+    client = discord.Client(**options)
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data=user(SELF_ID))
+    tracemalloc.start()
+    for gid in range(1, guilds + 1):
+        gid *= 10
+        guild = discord.Guild(data=guild_payload(gid, members, chunked), state=state)
+        state._add_guild(guild)
+        for mid in range(MESSAGES):
+            state.parse_message_create(message_payload(gid, gid * 1000 + mid, members))
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    cached_members = sum(len(g.members) for g in state.guilds)
+    cached_messages = len(state._messages or ())
+    return cached_members, cached_messages, traced, exact
+
+
+async def main() -> None:
+    guilds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    members = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    print(f"{guilds} guilds x {members} members, {MESSAGES} messages per guild")
+    print(f"{'profile':<10} {'members':>10} {'messages':>10} {'traced MiB':>12}  user count")
+    wrong = []
+    for profile in CACHE_PROFILES:
+        cached_members, cached_messages, traced, exact = await measure(profile, guilds, members)
+        print(
+            f"{profile:<10} {cached_members:>10,} {cached_messages:>10,} "
+            f"{traced / 1024**2:>12.1f}  {'exact' if exact else 'approximate'}"
+        )
+        # Every member plus the bot in each guild, user_count() is only exact when all are cached
+        if exact != (cached_members == guilds * (members + 1)):
+            wrong.append(profile)
+    if wrong:
+        print(f"caches_all_members() is wrong for: {', '.join(wrong)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+"""Offline Lavalink failover test
+
+Boots Totoro against a fake Discord and several fake Lavalink nodes, starts
+a player in every guild, gives some of them a different volume, a pause or
+a filter, then kills the node holding the most players. Reports how long
+each player took to start playing again on a surviving node and whether its
+track, position, volume, pause, filters and queue survived the move, and
+whether the moved players were spread over the surviving nodes instead of
+piling onto one. The killed node is then revived to check that it gets
+reconnected.
+
+    python benchmarks/failover.py --guilds 200 --nodes 3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from loadtest import ROOT, LoadTest, percentile
+
+import pomice
+from fake_lavalink import FakeLavalinkNode
+
+POSITION_TOLERANCE = 2000  # ms a resumed track may be off by
+
+
+class FailoverTest(LoadTest):
+    def __init__(self, args: argparse.Namespace):
+        super().__init__(args)
+        self.nodes = [FakeLavalinkNode() for _ in range(args.nodes)]
+        self.lavalink = self.nodes[0]
+
+    async def start_players(self) -> None:
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def start(index: int, gid: int) -> None:
+            async with semaphore:
+                reply = await self.step(
+                    "play", gid, "t!play https://bench/playlist/5",
+                    check=lambda m: "Enqueueing" in m["content"],
+                )
+                if reply:
+                    await self.discord.wait_for_edit(
+                        reply, check=lambda m: "to the queue" in m["content"]
+                    )
+            player = self.bot.get_guild(gid).voice_client
+            if index % 3 == 1:
+                await player.set_volume(40 + index % 50)
+            if index % 4 == 2:
+                await player.add_filter(pomice.Timescale.nightcore())
+            if index % 5 == 3:
+                await player.set_pause(True)
+
+        await asyncio.gather(
+            *(start(i, gid) for i, gid in enumerate(self.discord.guild_ids))
+        )
+
+    def expected_state(self, gid: int) -> dict:
+        player = self.bot.get_guild(gid).voice_client
+        return {
+            "track": player.current.track_id,
+            "position": player.position,
+            "volume": player.volume,
+            "paused": player.is_paused,
+            "filters": player.filters.get_all_payloads(),
+            "queue": len(player.queue),
+        }
+
+    def check(self, gid: int, expected: dict, fake) -> list[str]:
+        player = self.bot.get_guild(gid).voice_client
+        problems = []
+        if fake.track != expected["track"]:
+            problems.append("track")
+        if abs(fake.offset - expected["position"]) > POSITION_TOLERANCE:
+            problems.append(f"position ({fake.offset} vs {expected['position']:.0f})")
+        if fake.volume != expected["volume"]:
+            problems.append("volume")
+        if fake.paused != expected["paused"]:
+            problems.append("paused")
+        if fake.filters != expected["filters"]:
+            problems.append("filters")
+        if len(player.queue) != expected["queue"]:
+            problems.append("queue")
+        return problems
+
+    async def kill_and_measure(self) -> dict:
+        counts = [len(node.players) for node in self.nodes]
+        victim = self.nodes[counts.index(max(counts))]
+        survivors = [node for node in self.nodes if node is not victim]
+        affected = [gid for gid in self.discord.guild_ids if victim.player(gid)]
+        expected = {gid: self.expected_state(gid) for gid in affected}
+        before = [len(node.players) for node in survivors]
+
+        started = time.perf_counter()
+        await victim.kill()
+        pending = set(affected)
+        latencies: list[float] = []
+        problems: dict[int, list[str]] = {}
+        while pending and time.perf_counter() - started < self.args.timeout:
+            for gid in list(pending):
+                fake = next(
+                    (p for node in survivors if (p := node.player(gid)) and p.track), None
+                )
+                if fake is not None:
+                    latencies.append(time.perf_counter() - started)
+                    pending.discard(gid)
+                    if issues := self.check(gid, expected[gid], fake):
+                        problems[gid] = issues
+            await asyncio.sleep(0.01)
+
+        after = [len(node.players) for node in survivors]
+        revived = time.perf_counter()
+        await victim.start()
+        while len(self.bot.node_manager.available_nodes()) < len(self.nodes):
+            if time.perf_counter() - revived > self.args.timeout:
+                break
+            await asyncio.sleep(0.05)
+        return {
+            "players": len(affected),
+            "migrated": len(latencies),
+            "stranded": len(pending),
+            "mismatched": problems,
+            "spread": {"before": before, "after": after},
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "max_ms": round(max(latencies, default=0) * 1000, 1),
+            "reconnect_seconds": round(time.perf_counter() - revived, 2),
+            "reconnected": len(self.bot.node_manager.available_nodes()) == len(self.nodes),
+        }
+
+    async def run(self) -> dict:
+        with tempfile.TemporaryDirectory() as workdir:
+            await self.boot(workdir)
+            try:
+                await self.start_players()
+                await asyncio.sleep(self.args.play_for)
+                return await self.kill_and_measure()
+            finally:
+                await self.bot.close()
+                for node in self.nodes:
+                    await node.kill()
+                await self.discord.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--play-for", type=float, default=3, help="seconds before the kill")
+    parser.add_argument("--profile", default="minimal")
+    parser.add_argument("--timeout", type=float, default=15)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    args.shards, args.rest_delay, args.gateway_ratelimit = 1, 0, False
+
+    os.chdir(ROOT)
+    report = asyncio.run(FailoverTest(args).run())
+    print(
+        f"Killed a node with {report['players']} players: {report['migrated']} migrated, "
+        f"{report['stranded']} stranded, {len(report['mismatched'])} with lost state"
+    )
+    print(
+        f"Back to playing in p50 {report['p50_ms']}ms, p99 {report['p99_ms']}ms, "
+        f"max {report['max_ms']}ms"
+    )
+    spread = report["spread"]
+    # Moving players onto the least loaded nodes should never widen the gap between them
+    balanced = max(spread["after"]) - min(spread["after"]) <= max(
+        1, max(spread["before"]) - min(spread["before"])
+    )
+    print(
+        f"Surviving nodes went from {spread['before']} to {spread['after']} players"
+        f"{'' if balanced else ', NOT spread evenly'}"
+    )
+    for gid, issues in list(report["mismatched"].items())[:10]:
+        print(f"  guild {gid}: {', '.join(issues)}")
+    state = "reconnected" if report["reconnected"] else "NOT reconnected"
+    print(f"Revived node {state} after {report['reconnect_seconds']}s")
+    passed = report["migrated"] == report["players"] and not report["mismatched"] and balanced
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""A stand-in for Discord's REST API and gateway for offline benchmarks
+
+Simulates a single bot user in any number of guilds, each with a text channel,
+a voice channel and one listener sitting in it. Traffic is injected as
+MESSAGE_CREATE and button INTERACTION_CREATE events and the bot's replies are
+awaited on the REST side, so every round trip goes through discord.py just
+like it would in production.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+from typing import Any, Optional
+
+from aiohttp import WSMsgType, web
+
+BOT_ID = 1 << 22
+APPLICATION_ID = BOT_ID
+TIMESTAMP = "2024-01-01T00:00:00+00:00"
+
+
+def guild_id(index: int) -> int:
+    """Snowflakes whose timestamps spread guilds evenly across shards"""
+    return (index + 1) << 22
+
+
+def text_channel_id(gid: int) -> int:
+    return gid + 1
+
+
+def voice_channel_id(gid: int) -> int:
+    return gid + 2
+
+
+def listener_id(gid: int) -> int:
+    return gid + 3
+
+
+def user(uid: int, *, bot: bool = False) -> dict[str, Any]:
+    return {
+        "id": str(uid),
+        "username": f"user{uid}",
+        "global_name": None,
+        "discriminator": "0",
+        "avatar": None,
+        "bot": bot,
+    }
+
+
+def member(uid: int, **extra: Any) -> dict[str, Any]:
+    return {"roles": [], "joined_at": TIMESTAMP, "flags": 0, "deaf": False, "mute": False, **extra}
+
+
+def voice_state(gid: int, uid: int, channel_id: Optional[int], session_id: str = "bench") -> dict[str, Any]:
+    return {
+        "guild_id": str(gid),
+        "user_id": str(uid),
+        "channel_id": str(channel_id) if channel_id else None,
+        "session_id": session_id,
+        "deaf": False,
+        "mute": False,
+        "self_deaf": False,
+        "self_mute": False,
+        "self_video": False,
+        "suppress": False,
+        "request_to_speak_timestamp": None,
+    }
+
+
+def guild_payload(gid: int) -> dict[str, Any]:
+    everyone = {"id": str(gid), "name": "@everyone", "permissions": str((1 << 41) - 1), "position": 0}
+    return {
+        "id": str(gid),
+        "name": f"guild {gid}",
+        "owner_id": str(listener_id(gid)),
+        "member_count": 2,
+        "roles": [everyone],
+        "channels": [
+            {"id": str(text_channel_id(gid)), "type": 0, "name": "general", "position": 0},
+            {"id": str(voice_channel_id(gid)), "type": 2, "name": "music", "position": 1,
+             "bitrate": 64000, "user_limit": 0, "rtc_region": None},
+        ],
+        "members": [
+            member(BOT_ID, user=user(BOT_ID, bot=True)),
+            member(listener_id(gid), user=user(listener_id(gid))),
+        ],
+        "voice_states": [voice_state(gid, listener_id(gid), voice_channel_id(gid))],
+        "presences": [],
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "threads": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+        "large": False,
+        "unavailable": False,
+        "joined_at": TIMESTAMP,
+    }
+
+
+def json_response(data: Any, status: int = 200) -> web.Response:
+    """discord.py only parses bodies whose content type is exactly application/json"""
+    return web.Response(
+        body=json.dumps(data).encode(), status=status, headers={"Content-Type": "application/json"}
+    )
+
+
+class FakeDiscord:
+    """Serves the REST routes and the gateway the bot needs, all from one aiohttp app"""
+
+    def __init__(self, guilds: int, *, host: str = "127.0.0.1", port: int = 0, shards: int = 1):
+        self.guild_ids = [guild_id(i) for i in range(guilds)]
+        self.host = host
+        self.port = port
+        self.shards = shards
+        self.requests = 0
+        self.gateway_ready = asyncio.Event()
+        self.messages: dict[int, dict[str, Any]] = {}
+        self._ids = itertools.count(1 << 40)
+        self._sockets: dict[int, web.WebSocketResponse] = {}
+        self._dispatchers: dict[int, Any] = {}
+        self._identified: set[int] = set()
+        self._replies: defaultdict[int, list] = defaultdict(list)
+        self._edits: defaultdict[int, list] = defaultdict(list)
+        self._voice: defaultdict[int, list] = defaultdict(list)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def api_base(self) -> str:
+        return f"{self.url}/api/v10"
+
+    def snowflake(self) -> int:
+        return next(self._ids)
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=16 * 1024**2)
+        app.router.add_get("/gateway", self._gateway)
+        app.router.add_get("/api/v10/users/@me", self._me)
+        app.router.add_get("/api/v10/gateway/bot", self._gateway_bot)
+        app.router.add_get("/api/v10/oauth2/applications/@me", self._application)
+        app.router.add_post("/api/v10/channels/{channel}/messages", self._create_message)
+        app.router.add_patch("/api/v10/channels/{channel}/messages/{message}", self._edit_message)
+        app.router.add_post("/api/v10/interactions/{id}/{token}/callback", self._interaction_callback)
+        app.router.add_post("/api/v10/webhooks/{app}/{token}", self._followup)
+        app.router.add_route("*", "/api/v10/{tail:.*}", self._ignore)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = site._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        for ws in list(self._sockets.values()):
+            await ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    # REST
+
+    async def _me(self, _: web.Request) -> web.Response:
+        self.requests += 1
+        return json_response({**user(BOT_ID, bot=True), "verified": True, "mfa_enabled": False, "flags": 0})
+
+    async def _gateway_bot(self, _: web.Request) -> web.Response:
+        self.requests += 1
+        return json_response(
+            {
+                "url": f"ws://{self.host}:{self.port}/gateway",
+                "shards": self.shards,
+                "session_start_limit": {
+                    "total": 1000, "remaining": 1000, "reset_after": 0, "max_concurrency": 16
+                },
+            }
+        )
+
+    async def _application(self, _: web.Request) -> web.Response:
+        self.requests += 1
+        return json_response(
+            {"id": str(APPLICATION_ID), "name": "Totoro", "description": "", "icon": None,
+             "bot_public": True, "bot_require_code_grant": False, "verify_key": "", "flags": 0,
+             "owner": user(listener_id(guild_id(0)))}
+        )
+
+    def _message(self, channel_id: int, payload: dict[str, Any]) -> dict[str, Any]:
+        message = {
+            "id": str(self.snowflake()),
+            "channel_id": str(channel_id),
+            "author": user(BOT_ID, bot=True),
+            "content": payload.get("content") or "",
+            "embeds": payload.get("embeds", []),
+            "components": payload.get("components", []),
+            "attachments": [],
+            "mentions": [],
+            "mention_roles": [],
+            "mention_everyone": False,
+            "pinned": False,
+            "tts": False,
+            "type": 0,
+            "flags": payload.get("flags", 0),
+            "timestamp": TIMESTAMP,
+            "edited_timestamp": None,
+        }
+        self.messages[int(message["id"])] = message
+        return message
+
+    @staticmethod
+    def _resolve(waiters: list, message: dict[str, Any]) -> None:
+        for waiter in waiters:
+            future, check = waiter
+            if not future.done() and (check is None or check(message)):
+                future.set_result(message)
+                waiters.remove(waiter)
+                break
+
+    @staticmethod
+    def _expect(waiters: list, check) -> asyncio.Future:
+        """Register interest in a message before triggering it, so it can't be missed"""
+        future = asyncio.get_running_loop().create_future()
+        waiters.append((future, check))
+        return future
+
+    @staticmethod
+    async def _wait(waiters: list, future: asyncio.Future, timeout: float) -> dict:
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            waiters[:] = [w for w in waiters if w[0] is not future]
+
+    async def _create_message(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        channel_id = int(request.match_info["channel"])
+        message = self._message(channel_id, await request.json())
+        self._resolve(self._replies[channel_id], message)
+        return json_response(message)
+
+    async def _edit_message(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        message_id = int(request.match_info["message"])
+        message = self.messages.get(message_id)
+        if message is None:
+            return json_response({"message": "Unknown Message", "code": 10008}, status=404)
+        message.update({k: v for k, v in (await request.json()).items() if k in ("content", "embeds", "components")})
+        message["edited_timestamp"] = TIMESTAMP
+        self._resolve(self._edits[message_id], message)
+        return json_response(message)
+
+    async def _interaction_callback(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        return json_response(
+            {
+                "interaction": {"id": request.match_info["id"], "type": 3},
+                "resource": {"type": body["type"]},
+            }
+        )
+
+    async def _followup(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return json_response(self._message(0, await request.json()))
+
+    async def _ignore(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.Response(status=204)
+
+    # Gateway
+
+    async def _gateway(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        await ws.send_json({"op": 10, "d": {"heartbeat_interval": 41250}, "s": None, "t": None})
+        seq = itertools.count(1)
+        shard_id = 0
+
+        async def dispatch(event: str, data: dict[str, Any]) -> None:
+            await ws.send_json({"op": 0, "t": event, "s": next(seq), "d": data})
+
+        async for msg in ws:
+            if msg.type in (WSMsgType.CLOSE, WSMsgType.ERROR):
+                break
+            payload = msg.json()
+            op, data = payload["op"], payload["d"]
+            if op == 1:
+                await ws.send_json({"op": 11, "d": None, "s": None, "t": None})
+            elif op == 2:
+                shard_id, shard_count = data.get("shard", [0, 1])
+                self._sockets[shard_id] = ws
+                self._dispatchers[shard_id] = dispatch
+                guilds = [gid for gid in self.guild_ids if (gid >> 22) % shard_count == shard_id]
+                await dispatch(
+                    "READY",
+                    {
+                        "v": 10,
+                        "user": user(BOT_ID, bot=True),
+                        "guilds": [{"id": str(gid), "unavailable": True} for gid in guilds],
+                        "session_id": f"bench-{shard_id}",
+                        "resume_gateway_url": f"ws://{self.host}:{self.port}/gateway",
+                        "shard": [shard_id, shard_count],
+                        "application": {"id": str(APPLICATION_ID), "flags": 0},
+                    },
+                )
+                for gid in guilds:
+                    await dispatch("GUILD_CREATE", guild_payload(gid))
+                self._identified.add(shard_id)
+                if len(self._identified) >= self.shards:
+                    self.gateway_ready.set()
+            elif op == 4:
+                await self._voice_update(dispatch, data)
+        self._sockets.pop(shard_id, None)
+        self._dispatchers.pop(shard_id, None)
+        return ws
+
+    async def _voice_update(self, dispatch, data: dict[str, Any]) -> None:
+        gid = int(data["guild_id"])
+        channel_id = int(data["channel_id"]) if data.get("channel_id") else None
+        state = voice_state(gid, BOT_ID, channel_id, session_id=f"voice-{gid}")
+        state["member"] = member(BOT_ID, user=user(BOT_ID, bot=True))
+        await dispatch("VOICE_STATE_UPDATE", state)
+        self._resolve(self._voice[gid], state)
+        if channel_id:
+            await dispatch(
+                "VOICE_SERVER_UPDATE",
+                {"token": "bench", "guild_id": str(gid), "endpoint": "bench.discord.media:443"},
+            )
+
+    def _dispatch(self, gid: int, event: str, data: dict[str, Any]):
+        return self._dispatchers[(gid >> 22) % self.shards](event, data)
+
+    # Traffic
+
+    async def post_message(self, gid: int, content: str) -> None:
+        """Post a message in the guild's text channel as its listener"""
+        channel_id = text_channel_id(gid)
+        await self._dispatch(
+            gid,
+            "MESSAGE_CREATE",
+            {
+                "id": str(self.snowflake()),
+                "channel_id": str(channel_id),
+                "guild_id": str(gid),
+                "author": user(listener_id(gid)),
+                "member": member(listener_id(gid)),
+                "content": content,
+                "timestamp": TIMESTAMP,
+                "edited_timestamp": None,
+                "tts": False,
+                "mention_everyone": False,
+                "mentions": [],
+                "mention_roles": [],
+                "attachments": [],
+                "embeds": [],
+                "pinned": False,
+                "type": 0,
+            },
+        )
+
+    async def send_command(
+        self, gid: int, content: str, *, check=None, voice: bool = False, timeout: float = 10.0
+    ) -> tuple[float, dict]:
+        """Post a message and wait for the bot's reply
+
+        check filters which of the bot's messages in the channel count as the
+        reply. With voice=True the bot's next voice state update is awaited instead.
+        """
+        waiters = self._voice[gid] if voice else self._replies[text_channel_id(gid)]
+        future = self._expect(waiters, check)
+        started = time.perf_counter()
+        await self.post_message(gid, content)
+        message = await self._wait(waiters, future, timeout)
+        return time.perf_counter() - started, message
+
+    async def wait_for_edit(self, message: dict, *, check=None, timeout: float = 10.0) -> dict:
+        waiters = self._edits[int(message["id"])]
+        return await self._wait(waiters, self._expect(waiters, check), timeout)
+
+    @staticmethod
+    def button(message: dict, emoji: str) -> dict:
+        """The button with an emoji on one of the bot's messages"""
+        return next(
+            button
+            for row in message["components"]
+            for button in row["components"]
+            if (button.get("emoji") or {}).get("name") == emoji
+        )
+
+    async def click(self, gid: int, message: dict, emoji: str, *, timeout: float = 10.0) -> tuple[float, dict]:
+        """Press a button on one of the bot's messages and wait for the message edit"""
+        custom_id = self.button(message, emoji)["custom_id"]
+        waiters = self._edits[int(message["id"])]
+        future = self._expect(waiters, None)
+        started = time.perf_counter()
+        await self._dispatch(
+            gid,
+            "INTERACTION_CREATE",
+            {
+                "id": str(self.snowflake()),
+                "application_id": str(APPLICATION_ID),
+                "type": 3,
+                "token": f"bench-{message['id']}",
+                "version": 1,
+                "guild_id": str(gid),
+                "channel_id": message["channel_id"],
+                "channel": {"id": message["channel_id"], "type": 0},
+                "member": member(listener_id(gid), user=user(listener_id(gid)), permissions="0"),
+                "message": message,
+                "data": {"custom_id": custom_id, "component_type": 2},
+                "app_permissions": "0",
+                "attachment_size_limit": 8 * 1024**2,
+                "locale": "en-US",
+                "entitlements": [],
+                "authorizing_integration_owners": {},
+            },
+        )
+        message = await self._wait(waiters, future, timeout)
+        return time.perf_counter() - started, message
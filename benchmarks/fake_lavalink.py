@@ -0,0 +1,343 @@
+"""A stand-in Lavalink v4 node for offline benchmarks
+
+Serves the REST endpoints and websocket pomice talks to and answers every
+search with synthetic tracks. Tracks "play" for their length divided by
+`time_scale`, in real time by default, a scale of 1000 ends a 3 minute
+track after 180ms. Positions are reported with playerUpdate events every
+`update_interval` seconds like Lavalink does.
+
+Special identifiers:
+    ytsearch:<query>                one matching track (five if the query contains "pick")
+    https://bench/playlist/<n>      a playlist of n tracks
+    https://bench/dead/<anything>   no matches
+    anything else                   a single track
+"""
+
+import asyncio
+import itertools
+import json
+import time
+import zlib
+from collections import defaultdict
+from typing import Any, Optional
+
+from aiohttp import WSMsgType, web
+
+SEARCH_PREFIXES = ("ytsearch:", "ytmsearch:", "scsearch:")
+
+
+def track_info(identifier: str) -> dict[str, Any]:
+    length = 120_000 + zlib.crc32(identifier.encode()) % 180_000
+    return {
+        "identifier": identifier,
+        "isSeekable": True,
+        "author": f"Artist {identifier[:6]}",
+        "length": length,
+        "isStream": False,
+        "position": 0,
+        "title": f"Track {identifier}",
+        "uri": f"https://bench/track/{identifier}",
+        "artworkUrl": None,
+        "isrc": None,
+        "sourceName": "youtube",
+    }
+
+
+def encode(identifier: str) -> str:
+    return f"bench:{identifier}"
+
+
+def decode(encoded: str) -> str:
+    return encoded.removeprefix("bench:")
+
+
+def track(identifier: str) -> dict[str, Any]:
+    return {"encoded": encode(identifier), "info": track_info(identifier), "pluginInfo": {}}
+
+
+class FakePlayer:
+    __slots__ = (
+        "guild_id", "track", "paused", "volume", "filters", "voice", "started", "offset",
+        "time_scale", "end_task",
+    )
+
+    def __init__(self, guild_id: str, time_scale: float = 1.0):
+        self.guild_id = guild_id
+        self.track: Optional[str] = None
+        self.paused = False
+        self.volume = 100
+        self.filters: dict = {}
+        self.voice: dict = {}
+        self.started = 0.0
+        self.offset = 0  # Position in ms when the track was started or paused
+        self.time_scale = time_scale
+        self.end_task: Optional[asyncio.Task] = None
+
+    @property
+    def position(self) -> int:
+        if not self.track:
+            return 0
+        if self.paused:
+            return self.offset
+        return int(self.offset + (time.monotonic() - self.started) * 1000 * self.time_scale)
+
+    def state(self) -> dict[str, Any]:
+        return {
+            "time": int(time.time() * 1000),
+            "position": self.position,
+            "connected": True,
+            "ping": 0,
+        }
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "guildId": self.guild_id,
+            "track": track(decode(self.track)) if self.track else None,
+            "volume": self.volume,
+            "paused": self.paused,
+            "state": self.state(),
+            "voice": self.voice,
+            "filters": self.filters,
+        }
+
+
+class FakeLavalinkNode:
+    """Minimal Lavalink v4 server backed by aiohttp, can be killed and revived on demand"""
+
+    def __init__(
+        self,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        password: str = "youshallnotpass",
+        rest_delay: float = 0.0,
+        time_scale: float = 1.0,
+        stats_interval: float = 5.0,
+        update_interval: float = 5.0,
+    ):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.rest_delay = rest_delay
+        self.time_scale = time_scale
+        self.stats_interval = stats_interval
+        self.update_interval = update_interval
+        self.players: dict[tuple[str, str], FakePlayer] = {}
+        self.sockets: dict[str, web.WebSocketResponse] = {}
+        self.requests = 0
+        self._track_waiters: defaultdict[str, list[asyncio.Future]] = defaultdict(list)
+        self._session_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self._started = time.time()
+
+    @property
+    def uri(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        app = web.Application(middlewares=[self._auth])
+        app.router.add_get("/version", self._version)
+        app.router.add_get("/v4/websocket", self._websocket)
+        app.router.add_get("/v4/loadtracks", self._load_tracks)
+        app.router.add_get("/v4/decodetrack", self._decode_track)
+        app.router.add_get("/v4/stats", self._stats_handler)
+        app.router.add_patch("/v4/sessions/{session}", self._update_session)
+        app.router.add_patch("/v4/sessions/{session}/players/{guild}", self._update_player)
+        app.router.add_delete("/v4/sessions/{session}/players/{guild}", self._destroy_player)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if not self.port:  # Keep the OS assigned port so the node can be revived on it
+            self.port = site._server.sockets[0].getsockname()[1]
+
+    async def kill(self) -> None:
+        """Drop every connection and stop serving, like a crashed JVM would"""
+        for ws in list(self.sockets.values()):
+            await ws.close()
+        for player in self.players.values():
+            if player.end_task:
+                player.end_task.cancel()
+        self.players.clear()
+        self.sockets.clear()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    stop = kill
+
+    @web.middleware
+    async def _auth(self, request: web.Request, handler):
+        if request.headers.get("Authorization") != self.password:
+            return web.json_response({"message": "Unauthorized"}, status=401)
+        self.requests += 1
+        if self.rest_delay and request.path != "/v4/websocket":
+            await asyncio.sleep(self.rest_delay)
+        return await handler(request)
+
+    def player(self, guild_id: int) -> Optional[FakePlayer]:
+        """The player of a guild on this node, whichever session it belongs to"""
+        for (_, gid), player in self.players.items():
+            if gid == str(guild_id):
+                return player
+        return None
+
+    def expect_track(self, guild_id: int) -> asyncio.Future:
+        """Future resolved with the identifier of the next track started in a guild"""
+        future = asyncio.get_running_loop().create_future()
+        self._track_waiters[str(guild_id)].append(future)
+        return future
+
+    async def _version(self, _: web.Request) -> web.Response:
+        return web.Response(text="4.0.0", content_type="text/plain")
+
+    def _stats(self) -> dict[str, Any]:
+        playing = sum(1 for p in self.players.values() if p.track and not p.paused)
+        return {
+            "players": len(self.players),
+            "playingPlayers": playing,
+            "uptime": int((time.time() - self._started) * 1000),
+            "memory": {"free": 0, "used": 0, "allocated": 0, "reservable": 0},
+            "cpu": {"cores": 1, "systemLoad": 0.0, "lavalinkLoad": 0.0},
+            "frameStats": None,
+        }
+
+    async def _stats_handler(self, _: web.Request) -> web.Response:
+        return web.json_response(self._stats())
+
+    async def _websocket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        session = f"session-{next(self._session_ids)}"
+        self.sockets[session] = ws
+        await ws.send_json({"op": "ready", "resumed": False, "sessionId": session})
+        stats = asyncio.create_task(self._send_stats(ws))
+        updates = asyncio.create_task(self._send_updates(session, ws))
+        try:
+            async for msg in ws:
+                if msg.type in (WSMsgType.CLOSE, WSMsgType.ERROR):
+                    break
+        finally:
+            stats.cancel()
+            updates.cancel()
+            self.sockets.pop(session, None)
+        return ws
+
+    async def _send_stats(self, ws: web.WebSocketResponse) -> None:
+        while not ws.closed:
+            await ws.send_json({"op": "stats", **self._stats()})
+            await asyncio.sleep(self.stats_interval)
+
+    async def _send_updates(self, session: str, ws: web.WebSocketResponse) -> None:
+        """playerUpdate for every playing player, like Lavalink's playerUpdateInterval"""
+        while not ws.closed:
+            await asyncio.sleep(self.update_interval)
+            for (player_session, guild_id), player in list(self.players.items()):
+                if player_session == session and player.track:
+                    await self._player_update(session, player)
+
+    async def _player_update(self, session: str, player: FakePlayer) -> None:
+        ws = self.sockets.get(session)
+        if ws is not None and not ws.closed:
+            await ws.send_json(
+                {"op": "playerUpdate", "guildId": player.guild_id, "state": player.state()}
+            )
+
+    async def _load_tracks(self, request: web.Request) -> web.Response:
+        identifier = request.query.get("identifier", "")
+        if identifier.startswith("https://bench/dead/"):
+            return web.json_response({"loadType": "empty", "data": {}})
+        if identifier.startswith("https://bench/playlist/"):
+            size = int(identifier.rsplit("/", 1)[1])
+            base = zlib.crc32(identifier.encode())
+            return web.json_response(
+                {
+                    "loadType": "playlist",
+                    "data": {
+                        "info": {"name": f"Playlist of {size}", "selectedTrack": -1},
+                        "pluginInfo": {},
+                        "tracks": [track(f"p{base:x}-{i}") for i in range(size)],
+                    },
+                }
+            )
+        if identifier.startswith(SEARCH_PREFIXES):
+            query = identifier.split(":", 1)[1]
+            results = 5 if "pick" in query else 1
+            base = zlib.crc32(query.encode())
+            return web.json_response(
+                {"loadType": "search", "data": [track(f"s{base:x}-{i}") for i in range(results)]}
+            )
+        return web.json_response({"loadType": "track", "data": track(identifier.rsplit("/", 1)[-1])})
+
+    async def _decode_track(self, request: web.Request) -> web.Response:
+        return web.json_response(track(decode(request.query["encodedTrack"])))
+
+    async def _update_session(self, request: web.Request) -> web.Response:
+        return web.json_response({"resuming": False, "timeout": 60})
+
+    async def _event(self, session: str, guild_id: str, event: str, **data: Any) -> None:
+        ws = self.sockets.get(session)
+        if ws is None or ws.closed:
+            return
+        await ws.send_str(
+            json.dumps({"op": "event", "type": event, "guildId": guild_id, **data})
+        )
+
+    async def _finish(self, session: str, player: FakePlayer, delay: float) -> None:
+        await asyncio.sleep(delay)
+        ended, player.track = player.track, None
+        await self._event(
+            session, player.guild_id, "TrackEndEvent", track=track(decode(ended)), reason="finished"
+        )
+
+    async def _update_player(self, request: web.Request) -> web.Response:
+        session, guild_id = request.match_info["session"], request.match_info["guild"]
+        data = await request.json() if request.can_read_body else {}
+        player = self.players.get((session, guild_id))
+        if player is None:
+            player = self.players[session, guild_id] = FakePlayer(guild_id, self.time_scale)
+        if "voice" in data:
+            player.voice = data["voice"]
+        if "volume" in data:
+            player.volume = data["volume"]
+        if "paused" in data and data["paused"] != player.paused:
+            player.offset, player.started = player.position, time.monotonic()
+            player.paused = data["paused"]
+        if "filters" in data:
+            player.filters = data["filters"]
+        if "encodedTrack" in data:
+            no_replace = request.query.get("noReplace", "False").lower() == "true"
+            encoded = data["encodedTrack"]
+            if player.track and not (encoded and no_replace):
+                if player.end_task:
+                    player.end_task.cancel()
+                ended, player.track = player.track, None
+                await self._event(
+                    session,
+                    guild_id,
+                    "TrackEndEvent",
+                    track=track(decode(ended)),
+                    reason="replaced" if encoded else "stopped",
+                )
+            if encoded and not player.track:
+                player.track = encoded
+                player.started = time.monotonic()
+                player.offset = int(data.get("position") or 0)
+                await self._event(session, guild_id, "TrackStartEvent", track=track(decode(encoded)))
+                await self._player_update(session, player)
+                for future in self._track_waiters.pop(guild_id, []):
+                    if not future.done():
+                        future.set_result(decode(encoded))
+                remaining = track_info(decode(encoded))["length"] - player.offset
+                player.end_task = asyncio.create_task(
+                    self._finish(session, player, max(0, remaining) / 1000 / self.time_scale)
+                )
+        return web.json_response(player.to_json())
+
+    async def _destroy_player(self, request: web.Request) -> web.Response:
+        player = self.players.pop(
+            (request.match_info["session"], request.match_info["guild"]), None
+        )
+        if player and player.end_task:
+            player.end_task.cancel()
+        return web.Response(status=204)
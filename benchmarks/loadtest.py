@@ -0,0 +1,291 @@
+"""Offline load test for the whole bot
+
+Boots Totoro with every cog against a fake Discord gateway/REST API and a
+fake Lavalink node, then drives scripted music traffic through thousands of
+simulated guilds at once. Reports throughput, p50/p99 latency per step and
+memory use. Nothing leaves localhost and no tokens are needed.
+
+    python benchmarks/loadtest.py --guilds 2000 --concurrency 250
+
+Each guild runs the script below `--rounds` times, a bounded number of guilds
+at a time:
+
+    play <search>            joins voice, resolves and starts a track
+    play <playlist>          waits until the whole playlist is enqueued
+    queue                    sends the queue paginator
+    page (x3)                flips pages with the ➡️ button, up to the last page
+    skip (x2)
+    disconnect
+
+Discord only allows 120 gateway sends per minute per shard, which caps voice
+joins and leaves far below what the bot itself can handle. That limit is
+lifted by default so the bot is what gets measured, pass --gateway-ratelimit
+to keep it and see what a single shard really sustains.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "Totoro"))
+
+import discord
+from fake_discord import FakeDiscord, listener_id
+from fake_lavalink import FakeLavalinkNode
+
+CONFIG = """\
+token = "bench"
+owner_ids = [{owner}]
+cache_profile = "{profile}"
+database_path = "{database}"
+snapshot_interval = 3600
+"""
+
+NODE = """
+[[lavalink_nodes]]
+identifier = "{identifier}"
+host = "{host}"
+port = {port}
+password = "{password}"
+"""
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.discord = FakeDiscord(args.guilds, shards=args.shards)
+        self.lavalink = FakeLavalinkNode(rest_delay=args.rest_delay / 1000)
+        self.nodes = [self.lavalink]
+        self.latencies: defaultdict[str, list[float]] = defaultdict(list)
+        self.failures: Counter[str] = Counter()
+        self.peak_players = 0
+        self.bot = None
+
+    def record(self, step: str, latency: float) -> None:
+        self.latencies[step].append(latency)
+
+    async def step(self, step: str, gid: int, content: str, **kwargs) -> dict:
+        try:
+            latency, reply = await self.discord.send_command(
+                gid, content, timeout=self.args.timeout, **kwargs
+            )
+        except asyncio.TimeoutError:
+            self.failures[step] += 1
+            return {}
+        self.record(step, latency)
+        return reply
+
+    async def scenario(self, gid: int, round_: int) -> None:
+        args = self.args
+        await self.step(
+            "play search", gid, f"t!play bench song {gid} {round_}",
+            check=lambda m: "Enqueued" in m["content"],
+        )
+        self.peak_players = max(self.peak_players, len(self.bot.voice_clients))
+
+        started = time.perf_counter()
+        progress = await self.step(
+            "play playlist", gid, f"t!play https://bench/playlist/{args.playlist_size}",
+            check=lambda m: "Enqueueing" in m["content"],
+        )
+        if progress:
+            try:
+                await self.discord.wait_for_edit(
+                    progress,
+                    check=lambda m: "to the queue" in m["content"],
+                    timeout=args.timeout,
+                )
+                self.record("playlist enqueued", time.perf_counter() - started)
+            except asyncio.TimeoutError:
+                self.failures["playlist enqueued"] += 1
+
+        queue = await self.step("queue", gid, "t!queue", check=lambda m: bool(m["embeds"]))
+        for _ in range(args.pages if queue else 0):
+            if self.discord.button(queue, "➡️").get("disabled"):
+                break  # Already on the last page, the queue is shorter than --pages
+            try:
+                latency, queue = await self.discord.click(gid, queue, "➡️", timeout=args.timeout)
+            except asyncio.TimeoutError:
+                self.failures["page"] += 1
+                break
+            self.record("page", latency)
+
+        for _ in range(2):  # Skips are timed until Lavalink is told to play the next track
+            started = time.perf_counter()
+            next_track = self.lavalink.expect_track(gid)
+            await self.discord.post_message(gid, "t!skip")
+            try:
+                await asyncio.wait_for(next_track, args.timeout)
+                self.record("skip", time.perf_counter() - started)
+            except asyncio.TimeoutError:
+                self.failures["skip"] += 1
+        await self.step("disconnect", gid, "t!disconnect", voice=True)
+
+    async def run_guilds(self) -> float:
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def run(gid: int) -> None:
+            async with semaphore:
+                for round_ in range(self.args.rounds):
+                    await self.scenario(gid, round_)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run(gid) for gid in self.discord.guild_ids))
+        return time.perf_counter() - started
+
+    async def boot(self, workdir: str) -> float:
+        await self.discord.start()
+        for node in self.nodes:
+            await node.start()
+        discord.http.Route.BASE = self.discord.api_base
+        if not self.args.gateway_ratelimit:
+            discord.gateway.GatewayRatelimiter.__init__.__defaults__ = (1_000_000, 60.0)
+
+        config = os.path.join(workdir, "config.toml")
+        with open(config, "w") as file:
+            file.write(
+                CONFIG.format(
+                    owner=listener_id(self.discord.guild_ids[0]),
+                    profile=self.args.profile,
+                    database=os.path.join(workdir, "totoro.db"),
+                )
+            )
+            for i, node in enumerate(self.nodes):
+                file.write(
+                    NODE.format(
+                        identifier="bench" if i == 0 else f"bench-{i}",
+                        host=node.host,
+                        port=node.port,
+                        password=node.password,
+                    )
+                )
+        os.environ["TOTORO_CONFIG"] = config
+        from core import TotoroBot  # Reads the config on import
+
+        started = time.perf_counter()
+        self.bot = TotoroBot()
+        logging.getLogger().setLevel(self.args.log_level)  # Over the [logging] level
+        self._startup = asyncio.create_task(self.bot.startup())
+        while not (
+            self.bot.is_ready()
+            and len(self.bot.node_manager.available_nodes()) == len(self.nodes)
+        ):
+            if self._startup.done():
+                self._startup.result()  # Surface whatever stopped the bot from booting
+                raise RuntimeError("Totoro exited while booting")
+            await asyncio.sleep(0.05)
+        return time.perf_counter() - started
+
+    def report(self, boot: float, elapsed: float) -> dict:
+        from core.metrics import rss_bytes
+
+        rss = rss_bytes() or 0
+        peak_rss = max(rss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+        steps = {
+            step: {
+                "count": len(values),
+                "failed": self.failures[step],
+                "p50_ms": round(percentile(values, 0.5) * 1000, 2),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+                "max_ms": round(max(values, default=0) * 1000, 2),
+            }
+            for step, values in self.latencies.items()
+        }
+        for step, failed in self.failures.items():
+            steps.setdefault(step, {"count": 0, "failed": failed})
+        operations = sum(len(v) for v in self.latencies.values())
+        return {
+            "guilds": self.args.guilds,
+            "concurrency": self.args.concurrency,
+            "rounds": self.args.rounds,
+            "boot_seconds": round(boot, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "operations": operations,
+            "throughput_per_second": round(operations / elapsed, 1) if elapsed else 0,
+            "peak_players": self.peak_players,
+            "discord_requests": self.discord.requests,
+            "lavalink_requests": self.lavalink.requests,
+            "rss_mib": round(rss / 1024**2, 1),
+            "peak_rss_mib": round(peak_rss / 1024**2, 1),
+            "track_cache": dict(self.bot.track_cache.stats),
+            "steps": steps,
+        }
+
+    async def run(self) -> dict:
+        with tempfile.TemporaryDirectory() as workdir:
+            boot = await self.boot(workdir)
+            try:
+                elapsed = await self.run_guilds()
+                return self.report(boot, elapsed)
+            finally:
+                await self.bot.close()
+                for node in self.nodes:
+                    await node.kill()
+                await self.discord.close()
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{report['guilds']} guilds x {report['rounds']} rounds, "
+        f"{report['concurrency']} at a time, booted in {report['boot_seconds']}s"
+    )
+    print(
+        f"{report['operations']} operations in {report['elapsed_seconds']}s "
+        f"({report['throughput_per_second']}/s), peak {report['peak_players']} players"
+    )
+    print(
+        f"RSS {report['rss_mib']} MiB (peak {report['peak_rss_mib']} MiB), "
+        f"{report['discord_requests']} Discord / {report['lavalink_requests']} Lavalink requests"
+    )
+    print()
+    print(f"{'step':<20}{'count':>8}{'failed':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for step, stats in report["steps"].items():
+        print(
+            f"{step:<20}{stats['count']:>8}{stats['failed']:>8}"
+            f"{stats.get('p50_ms', 0):>10}{stats.get('p99_ms', 0):>10}{stats.get('max_ms', 0):>10}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200, help="guilds running at once")
+    parser.add_argument("--rounds", type=int, default=1, help="script runs per guild")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--playlist-size", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=3, help="queue page flips per round")
+    parser.add_argument("--rest-delay", type=float, default=0, help="added Lavalink REST latency in ms")
+    parser.add_argument("--profile", default="minimal", help="cache profile to run with")
+    parser.add_argument("--timeout", type=float, default=15)
+    parser.add_argument(
+        "--gateway-ratelimit", action="store_true", help="keep Discord's per shard send limit"
+    )
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)  # Cogs are loaded relative to the repository root
+    report = asyncio.run(LoadTest(args).run())
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Micro-benchmarks for the helpers and Music paths run on every interaction
+
+Times chunk_iter, humanize_timedelta, queue filling and page rendering,
+paginator flip sequences and track selector construction against queues of
+10 to 100k fake tracks. Everything runs offline on pomice.Track objects
+built from made up track info, no Lavalink or Discord needed.
+
+Results are compared against the committed baseline, pass --save to replace
+it after a deliberate change. Timings are the median of several runs, in
+microseconds per operation, with garbage collection paused like timeit does,
+so compare runs from the same machine.
+
+    python benchmarks/micro.py                 # compare against the baseline
+    python benchmarks/micro.py --filter queue  # only cases with "queue" in their name
+    python benchmarks/micro.py --save          # write a new baseline
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Callable, NamedTuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "Totoro"))
+
+import pomice
+from cogs.music import SelectorView, TotoroTrackSelector
+from utils import Paginator, PlayerDisplay, TrackQueue, chunk_iter, humanize_timedelta
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+QUEUE_SIZES = (10, 100, 1_000, 10_000, 100_000)
+
+
+@lru_cache(maxsize=2)
+def fake_tracks(count: int, *, seed: int = 0) -> list[pomice.Track]:
+    """Playable YouTube-like tracks with made up, but realistically sized, info"""
+    rng = random.Random(seed)
+    tracks = []
+    for i in range(count):
+        identifier = f"{rng.getrandbits(40):011x}"
+        tracks.append(
+            pomice.Track(
+                track_id=f"QAAA{identifier}" + "A" * 120,
+                info={
+                    "title": f"Track {i} ({rng.choice(['Official Video', 'Live', 'Remix'])})",
+                    "author": f"Artist {rng.randrange(count // 4 + 1)}",
+                    "length": rng.randrange(60_000, 600_000),
+                    "uri": f"https://www.youtube.com/watch?v={identifier}",
+                    "identifier": identifier,
+                    "isStream": False,
+                    "isSeekable": True,
+                },
+                track_type=pomice.TrackType.YOUTUBE,
+            )
+        )
+    return tracks
+
+
+def filled_queue(size: int) -> TrackQueue:
+    queue = TrackQueue(max_size=None)
+    queue.put_many(fake_tracks(size))
+    return queue
+
+
+def flip_sequence(pages: int, *, seed: int = 0) -> list[int]:
+    """Right to the end (at most 20 pages), back to the start, then random jumps"""
+    forward = list(range(min(pages, 20)))
+    rng = random.Random(seed)
+    return forward + forward[::-1] + [rng.randrange(pages) for _ in range(20)]
+
+
+class Case(NamedTuple):
+    name: str
+    sizes: tuple[int, ...]
+    setup: Callable[[int], Callable[[], object]]  # size -> the operation to time
+
+
+def chunk_iter_case(size: int) -> Callable[[], object]:
+    items = list(range(size))
+    return lambda: sum(1 for _ in chunk_iter(items, 10))
+
+
+def humanize_case(precise: bool) -> Callable[[int], Callable[[], object]]:
+    def setup(size: int) -> Callable[[], object]:
+        rng = random.Random(size)
+        deltas = [timedelta(milliseconds=rng.randrange(1_000, 36_000_000)) for _ in range(size)]
+
+        def run() -> None:
+            for delta in deltas:
+                humanize_timedelta(delta, precise=precise)
+
+        return run
+
+    return setup
+
+
+def queue_fill_case(size: int) -> Callable[[], object]:
+    tracks = fake_tracks(size)
+
+    def run() -> None:
+        TrackQueue(max_size=None).put_many(tracks)
+
+    return run
+
+
+def queue_page_cold_case(size: int) -> Callable[[], object]:
+    # What t!queue costs right after the queue changed, nothing formatted yet
+    player = SimpleNamespace(queue=filled_queue(size))
+    return lambda: PlayerDisplay(player).queue_page(0)
+
+
+def queue_page_cached_case(size: int) -> Callable[[], object]:
+    display = PlayerDisplay(SimpleNamespace(queue=filled_queue(size)))
+    display.queue_page(0)
+    return lambda: display.queue_page(0)
+
+
+def queue_page_after_play_case(size: int) -> Callable[[], object]:
+    # A track enqueued and the next one started, then the first page shown again
+    player = SimpleNamespace(queue=filled_queue(size))
+    display = PlayerDisplay(player)
+    display.queue_page(0)
+
+    def run() -> None:
+        player.queue.put(player.queue.get())
+        display.queue_page(0)
+
+    return run
+
+
+def queue_flip_case(size: int) -> Callable[[], object]:
+    # Every page of a flip sequence rendered once after a change to the queue
+    player = SimpleNamespace(queue=filled_queue(size))
+    display = PlayerDisplay(player)
+    pages = flip_sequence(display.page_count())
+
+    def run() -> None:
+        player.queue.version += 1
+        for index in pages:
+            display.queue_page(index)
+
+    return run
+
+
+class NullMessage:
+    async def edit(self, **_) -> None:
+        pass
+
+
+def paginator_case(loop: asyncio.AbstractEventLoop) -> Callable[[int], Callable[[], object]]:
+    def setup(size: int) -> Callable[[], object]:
+        display = PlayerDisplay(SimpleNamespace(queue=filled_queue(size)))
+        pages = flip_sequence(display.page_count())
+
+        async def flips() -> None:
+            # Through the button handlers' path, every flip waited out before the next
+            paginator = Paginator(display.queue_page, display.page_count, debounce=0)
+            paginator.message = NullMessage()
+            for index in pages:
+                paginator._flip(index)
+                if paginator._flush_task is not None:
+                    await paginator._flush_task
+            paginator.stop()
+
+        return lambda: loop.run_until_complete(flips())
+
+    return setup
+
+
+def selector_case(loop: asyncio.AbstractEventLoop) -> Callable[[int], Callable[[], object]]:
+    def setup(size: int) -> Callable[[], object]:
+        tracks = fake_tracks(size)
+
+        async def build() -> None:
+            SelectorView().add_item(TotoroTrackSelector(None, tracks)).stop()
+
+        return lambda: loop.run_until_complete(build())
+
+    return setup
+
+
+def cases(loop: asyncio.AbstractEventLoop) -> list[Case]:
+    return [
+        Case("chunk_iter", QUEUE_SIZES, chunk_iter_case),
+        Case("humanize_timedelta", (10, 100, 1_000), humanize_case(False)),
+        Case("humanize_timedelta precise", (10, 100, 1_000), humanize_case(True)),
+        Case("queue fill", QUEUE_SIZES, queue_fill_case),
+        Case("queue page cold", QUEUE_SIZES, queue_page_cold_case),
+        Case("queue page cached", QUEUE_SIZES, queue_page_cached_case),
+        Case("queue page after play", QUEUE_SIZES, queue_page_after_play_case),
+        Case("queue flip sequence", QUEUE_SIZES, queue_flip_case),
+        Case("paginator flip sequence", QUEUE_SIZES, paginator_case(loop)),
+        Case("track selector", (5, 10, 100), selector_case(loop)),
+    ]
+
+
+def measure(op: Callable[[], object], *, min_time: float, repeat: int) -> float:
+    """Median seconds per call, each run looping for at least min_time"""
+
+    def timed(number: int) -> float:
+        # Like timeit, collections are kept out of the timings, when they happen
+        # to kick in varies too much between runs of allocation heavy cases
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            for _ in range(number):
+                op()
+            return time.perf_counter() - started
+        finally:
+            gc.enable()
+
+    op()  # Warm up caches and lazy imports
+    number = 1
+    while (elapsed := timed(number)) < min_time:
+        # Aim straight for min_time, but don't trust a single tiny measurement too much
+        number = min(number * 10, max(number * 2, int(number * min_time / elapsed) + 1))
+    runs = [elapsed / number] + [timed(number) / number for _ in range(repeat - 1)]
+    return statistics.median(runs)
+
+
+def run_cases(args: argparse.Namespace) -> dict[str, float]:
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        for case in cases(loop):
+            if args.filter and args.filter not in case.name:
+                continue
+            for size in case.sizes:
+                if size > args.max_size:
+                    continue
+                op = case.setup(size)
+                key = f"{case.name}[{size}]"
+                results[key] = round(
+                    measure(op, min_time=args.min_time, repeat=args.repeat) * 1e6, 3
+                )
+                print(f"  {key:<40}{results[key]:>14.2f} us", file=sys.stderr)
+    finally:
+        loop.close()
+    return results
+
+
+def print_comparison(results: dict[str, float], baseline: dict, threshold: float) -> int:
+    """Print results next to the baseline, returns how many regressed past the threshold"""
+    previous = baseline.get("results", {})
+    print(
+        f"Baseline: Python {baseline.get('python', '?')} on {baseline.get('machine', '?')}, "
+        f"now: Python {platform.python_version()} on {platform.machine()}"
+    )
+    print(f"\n{'case':<40}{'baseline us':>14}{'now us':>14}{'change':>10}")
+    regressed = 0
+    for key, now in results.items():
+        before = previous.get(key)
+        if before is None:
+            print(f"{key:<40}{'-':>14}{now:>14.2f}{'new':>10}")
+            continue
+        change = (now - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag, regressed = " slower", regressed + 1
+        elif change < -threshold:
+            flag = " faster"
+        print(f"{key:<40}{before:>14.2f}{now:>14.2f}{change:>+10.0%}{flag}")
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", help="only run cases whose name contains this")
+    parser.add_argument("--max-size", type=int, default=max(QUEUE_SIZES))
+    parser.add_argument("--min-time", type=float, default=0.1, help="seconds per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per case")
+    parser.add_argument("--threshold", type=float, default=0.25, help="change flagged, 0.25 = 25%%")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results as the baseline")
+    parser.add_argument(
+        "--check", action="store_true", help="exit with 1 if any case regressed past the threshold"
+    )
+    args = parser.parse_args()
+
+    results = run_cases(args)
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+            file.write("\n")
+        print(f"Saved {len(results)} results to {os.path.relpath(args.baseline)}")
+        return
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    regressed = print_comparison(results, baseline, args.threshold)
+    if regressed:
+        print(f"\n{regressed} cases slower than the baseline by over {args.threshold:.0%}")
+    sys.exit(1 if args.check and regressed else 0)
+
+
+if __name__ == "__main__":
+    main()